@@ -0,0 +1,294 @@
+# audio_chunking.py
+
+import os
+import re
+import asyncio
+import tempfile
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+import ffmpeg
+from .metrics import timed
+
+# Whisper rejects uploads over 25 MB; anything larger must be split
+WHISPER_MAX_UPLOAD_BYTES = int(os.getenv("WHISPER_MAX_UPLOAD_BYTES", 24 * 1024 * 1024))
+
+# Target length of each chunk, and how far either side of the ideal cut point
+# we are willing to move it to land in a silence
+CHUNK_TARGET_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", 300))
+SILENCE_SEARCH_SECONDS = float(os.getenv("WHISPER_SILENCE_SEARCH_SECONDS", 20))
+
+# Audio shared by neighbouring chunks so words at a cut are heard in full by one of them
+CHUNK_OVERLAP_SECONDS = float(os.getenv("WHISPER_CHUNK_OVERLAP_SECONDS", 2))
+
+# Maximum number of chunks sent to Whisper at the same time for one file
+WHISPER_MAX_WORKERS = int(os.getenv("WHISPER_MAX_WORKERS", 8))
+
+SILENCE_NOISE_LEVEL = os.getenv("WHISPER_SILENCE_NOISE", "-35dB")
+SILENCE_MIN_DURATION = float(os.getenv("WHISPER_SILENCE_MIN_DURATION", 0.4))
+
+_SILENCE_START_RE = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END_RE = re.compile(r"silence_end: (-?[\d.]+)")
+_NORMALISE_RE = re.compile(r"[^\w\s]")
+
+
+class AudioChunk(NamedTuple):
+    # Window actually cut from the source file, including overlap
+    start: float
+    end: float
+    # Part of the window this chunk is authoritative for when merging
+    core_start: float
+    core_end: float
+
+
+def probe_duration(path: str) -> float:
+    """Return the duration of a media file in seconds"""
+    info = ffmpeg.probe(path)
+    return float(info["format"]["duration"])
+
+
+def detect_silences(path: str) -> List[Tuple[float, float]]:
+    """
+    Run ffmpeg's silencedetect filter over the file and return (start, end) pairs
+    for every silent stretch it reports.
+    """
+    _, stderr = (
+        ffmpeg
+        .input(path)
+        .filter("silencedetect", noise=SILENCE_NOISE_LEVEL, d=SILENCE_MIN_DURATION)
+        .output("-", format="null")
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    log = stderr.decode("utf-8", errors="ignore")
+    starts = [float(value) for value in _SILENCE_START_RE.findall(log)]
+    ends = [float(value) for value in _SILENCE_END_RE.findall(log)]
+    return list(zip(starts, ends))
+
+
+def plan_chunks(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    target: float = CHUNK_TARGET_SECONDS,
+    overlap: float = CHUNK_OVERLAP_SECONDS,
+    search: float = SILENCE_SEARCH_SECONDS,
+) -> List[AudioChunk]:
+    """
+    Split [0, duration] into windows of roughly `target` seconds.
+
+    Each cut is moved to the middle of the silence nearest the ideal cut point
+    (within `search` seconds), and every window is widened by `overlap` on both
+    sides so a word clipped at one cut is still heard whole by the neighbour.
+    """
+    silence_midpoints = sorted((start + end) / 2 for start, end in silences)
+
+    cuts = []
+    position = 0.0
+    while duration - position > target + search:
+        ideal = position + target
+        candidates = [
+            point for point in silence_midpoints
+            if ideal - search <= point <= ideal + search and point > position
+        ]
+        cut = min(candidates, key=lambda point: abs(point - ideal)) if candidates else ideal
+        cuts.append(cut)
+        position = cut
+
+    boundaries = [0.0] + cuts + [duration]
+    chunks = []
+    for core_start, core_end in zip(boundaries, boundaries[1:]):
+        chunks.append(AudioChunk(
+            start=max(0.0, core_start - overlap),
+            end=min(duration, core_end + overlap),
+            core_start=core_start,
+            core_end=core_end,
+        ))
+    return chunks
+
+
+def extract_chunk(source_path: str, chunk: AudioChunk, output_path: str):
+    """Cut one window out of the source as compact mono audio for Whisper"""
+    (
+        ffmpeg
+        .input(source_path, ss=chunk.start, t=chunk.end - chunk.start)
+        .output(output_path, vn=None, ac=1, ar=16000, acodec="libmp3lame", audio_bitrate="48k")
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+
+def _normalise(text: str) -> str:
+    return " ".join(_NORMALISE_RE.sub("", text.lower()).split())
+
+
+def _is_overlap_duplicate(previous: Dict, text: str, start: float) -> bool:
+    """
+    True when a segment at the start of a chunk repeats the last segment of the
+    chunk before, which happens when one utterance straddles the cut and both
+    windows transcribe it. The two must overlap in time: a repetition spoken
+    afterwards ("Bonjour." ... "Bonjour.") is real speech and is kept.
+    """
+    if start >= previous["end"]:
+        return False
+    current, last = _normalise(text), _normalise(previous["text"])
+    if not current or not last:
+        return False
+    return current == last or last.endswith(current) or current.endswith(last)
+
+
+def merge_chunk_segments(
+    merged: List[Dict],
+    chunk: AudioChunk,
+    result: Dict,
+    is_last: bool,
+    overlap: float = CHUNK_OVERLAP_SECONDS,
+) -> List[Dict]:
+    """
+    Append one chunk's segments to `merged` (the chunks before it, already merged)
+    and return the ones that were added.
+
+    Segment times are shifted by the chunk's start offset, and a segment is kept only
+    if its midpoint falls inside the chunk's core range, so each stretch of audio is
+    represented once even though the windows overlap. Segments starting within
+    `overlap` of the cut are also checked against the previous chunk's last
+    segment, in case both windows transcribed an utterance that straddles it.
+    """
+    # merged[boundary - 1] is the previous chunk's last segment
+    boundary = len(merged)
+    added = []
+    for segment in result["segments"]:
+        start = segment["start"] + chunk.start
+        end = segment["end"] + chunk.start
+        midpoint = (start + end) / 2
+        if midpoint < chunk.core_start:
+            continue
+        if midpoint >= chunk.core_end and not is_last:
+            continue
+        if (
+            boundary
+            and start < chunk.core_start + overlap
+            and _is_overlap_duplicate(merged[boundary - 1], segment["text"], start)
+        ):
+            continue
+        merged.append({
+            "text": segment["text"],
+            "start": round(start, 3),
+            "end": round(end, 3),
+        })
+        added.append(merged[-1])
+    return added
+
+
+def _transcript(segments: List[Dict]) -> Dict:
+    full_text = " ".join(segment["text"].strip() for segment in segments)
+    return {
+        "text": full_text,
+        "segments": segments
+    }
+
+
+def merge_chunk_transcripts(
+    chunks: List[AudioChunk],
+    results: List[Dict],
+    overlap: float = CHUNK_OVERLAP_SECONDS,
+) -> Dict:
+    """Stitch per-chunk transcripts back into one"""
+    segments = []
+    last_index = len(chunks) - 1
+    for index, (chunk, result) in enumerate(zip(chunks, results)):
+        merge_chunk_segments(segments, chunk, result, index == last_index, overlap)
+    return _transcript(segments)
+
+
+def needs_chunking(path: str, duration: float) -> bool:
+    """Whether a file is too big or too long to send to Whisper in one request"""
+    if os.path.getsize(path) > WHISPER_MAX_UPLOAD_BYTES:
+        return True
+    return duration > CHUNK_TARGET_SECONDS + SILENCE_SEARCH_SECONDS
+
+
+SegmentCallback = Callable[[int, List[Dict]], Awaitable[None]]
+
+
+async def transcribe_in_chunks(
+    path: str,
+    transcribe_file: Callable[[str], Awaitable[Dict]],
+    max_workers: int = WHISPER_MAX_WORKERS,
+    on_segments: Optional[SegmentCallback] = None,
+    duration: Optional[float] = None,
+) -> Dict:
+    """
+    Transcribe a long file by splitting it at silences and transcribing the
+    pieces concurrently.
+
+    `transcribe_file` is a coroutine function taking a local path and returning
+    {"text": str, "segments": [...]}; at most `max_workers` chunks are in flight at
+    once, so wall-clock time tracks the slowest chunk rather than the total duration.
+
+    If given, `on_segments(first_index, segments)` is awaited with each chunk's
+    merged segments as soon as that chunk and every chunk before it are done, so
+    a caller can stream the transcript in order while later chunks still run.
+    If any chunk fails, the others are cancelled and its error is raised.
+
+    Pass `duration` if the caller has already probed the file.
+    """
+    loop = asyncio.get_running_loop()
+
+    if duration is None:
+        with timed("probe"):
+            duration = await loop.run_in_executor(None, probe_duration, path)
+    if not needs_chunking(path, duration):
+        transcript_data = await transcribe_file(path)
+        if on_segments and transcript_data["segments"]:
+            await on_segments(0, transcript_data["segments"])
+        return transcript_data
+
+    with timed("silence_detect"):
+        silences = await loop.run_in_executor(None, detect_silences, path)
+    chunks = plan_chunks(duration, silences)
+    print(f"Transcribing {duration:.0f}s of audio in {len(chunks)} chunks")
+
+    semaphore = asyncio.Semaphore(max(max_workers, 1))
+    merged: List[Dict] = []
+    finished: Dict[int, Dict] = {}
+    next_to_merge = 0
+    merge_lock = asyncio.Lock()
+
+    async def merge_ready():
+        # Chunks finish in any order; merge (and report) them strictly in sequence
+        nonlocal next_to_merge
+        async with merge_lock:
+            while next_to_merge in finished:
+                index = next_to_merge
+                first_index = len(merged)
+                added = merge_chunk_segments(
+                    merged, chunks[index], finished.pop(index), index == len(chunks) - 1
+                )
+                next_to_merge += 1
+                if on_segments and added:
+                    await on_segments(first_index, added)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        async def run_chunk(index: int, chunk: AudioChunk):
+            async with semaphore:
+                chunk_path = os.path.join(temp_dir, f"chunk_{index:04d}.mp3")
+                with timed("extract_chunk"):
+                    extract = loop.run_in_executor(None, extract_chunk, path, chunk, chunk_path)
+                    try:
+                        await asyncio.shield(extract)
+                    except asyncio.CancelledError:
+                        # The thread can't be interrupted; let it finish before temp_dir goes
+                        await asyncio.wait([extract])
+                        raise
+                finished[index] = await transcribe_file(chunk_path)
+            await merge_ready()
+
+        tasks = [asyncio.ensure_future(run_chunk(index, chunk)) for index, chunk in enumerate(chunks)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # If a chunk failed the whole transcription has; cancel the rest so
+            # they make no more Whisper calls, and wait for them to unwind
+            # before temp_dir is removed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return _transcript(merged)
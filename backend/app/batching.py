@@ -0,0 +1,93 @@
+# batching.py
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+
+class MicroBatcher:
+    """
+    Collect individual lookups for a short window and send them upstream together.
+
+    `handler` receives a list of distinct keys and returns a dict mapping each key
+    to its result, or to an Exception instance when that key alone failed. If the
+    handler itself raises, every caller in the batch gets that error; if it is
+    cancelled, so is every caller's wait.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        max_batch_size: int,
+        max_delay: float,
+    ):
+        self.handler = handler
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_delay = max_delay
+        self.batches = 0
+        self.items = 0
+        self._pending: Dict[Hashable, List[asyncio.Future]] = {}
+        self._timer = None
+        self._dispatching: Set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._dispatch(batch))
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self._dispatching.add(task)
+        task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: Dict[Hashable, List[asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.handler(list(batch))
+        except BaseException as e:
+            # Every submitter is waiting on this batch, so none may be left
+            # pending, even when the dispatch itself is cancelled
+            for futures in batch.values():
+                for future in futures:
+                    if future.done():
+                        continue
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        for key, futures in batch.items():
+            result = results.get(key)
+            if result is None:
+                result = Exception(f"No result returned for {key}")
+            for future in futures:
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "batchedItems": self.items,
+        }
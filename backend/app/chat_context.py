@@ -0,0 +1,196 @@
+# chat_context.py
+
+import os
+import re
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# Approximate prompt tokens allowed for transcript context in a chat request
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 3000))
+
+# Segments either side of the highlighted text that are always included
+CHAT_CONTEXT_NEIGHBOURS = int(os.getenv("CHAT_CONTEXT_NEIGHBOURS", 3))
+
+# Transcripts without segments are split into passages of roughly this many characters
+PASSAGE_CHARS = 400
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?。！？])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) without a tokenizer"""
+    return len(text) // 4 + 1
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def split_passages(transcript: str, max_chars: int = PASSAGE_CHARS) -> List[str]:
+    """Group sentences into passages for transcripts that came without segments"""
+    passages, current = [], ""
+    for sentence in _SENTENCE_RE.split(transcript.strip()):
+        if current and len(current) + len(sentence) > max_chars:
+            passages.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+class ContextIndex:
+    """
+    BM25 index over the units (segments or passages) of one transcript, used to
+    pick the parts most relevant to a question.
+    """
+
+    def __init__(self, units: List[str]):
+        self.units = units
+        self.lengths = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for index, unit in enumerate(units):
+            tokens = tokenize(unit)
+            self.lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                self.postings[term].append((index, count))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    @classmethod
+    def from_transcript(cls, transcript: str, segments: Optional[List[Dict]] = None) -> "ContextIndex":
+        if segments:
+            units = [segment["text"].strip() for segment in segments if segment.get("text", "").strip()]
+        else:
+            units = split_passages(transcript)
+        return cls(units)
+
+    def score(self, query: str) -> Dict[int, float]:
+        """BM25 score for every unit sharing at least one term with the query"""
+        scores: Dict[int, float] = defaultdict(float)
+        total = len(self.units)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                length_norm = 1 - BM25_B + BM25_B * self.lengths[index] / (self.average_length or 1)
+                scores[index] += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * length_norm)
+        return scores
+
+    def locate(self, selected_text: str) -> List[int]:
+        """
+        Indices of the units covering the highlighted text. Falls back to the best
+        BM25 match when the selection doesn't appear verbatim (e.g. it was edited).
+        """
+        needle = " ".join(tokenize(selected_text))
+        if not needle:
+            return []
+
+        # Search the normalised, concatenated transcript so selections spanning
+        # several segments are found too
+        offsets, parts, position = [], [], 0
+        for unit in self.units:
+            normalised = " ".join(tokenize(unit))
+            offsets.append(position)
+            parts.append(normalised)
+            position += len(normalised) + 1
+        haystack = " ".join(parts)
+
+        found = haystack.find(needle)
+        if found == -1:
+            scores = self.score(selected_text)
+            return [max(scores, key=scores.get)] if scores else []
+
+        found_end = found + len(needle)
+        return [
+            index for index, offset in enumerate(offsets)
+            if offset < found_end and offset + len(parts[index]) > found
+        ]
+
+    def select(self, query: str, selected_text: str = "", budget: int = CHAT_CONTEXT_TOKEN_BUDGET,
+               neighbours: int = CHAT_CONTEXT_NEIGHBOURS) -> List[int]:
+        """
+        Choose unit indices to fill `budget` tokens: the highlighted units and their
+        neighbours first, then the highest scoring units for the question, then
+        units spread evenly over the transcript.
+        """
+        chosen, used = set(), 0
+
+        def take(index: int) -> bool:
+            nonlocal used
+            if index in chosen or not 0 <= index < len(self.units):
+                return True
+            cost = estimate_tokens(self.units[index])
+            if used + cost > budget:
+                return False
+            chosen.add(index)
+            used += cost
+            return True
+
+        anchors = self.locate(selected_text) if selected_text else []
+        for index in anchors:
+            take(index)
+        if anchors:
+            # Widen symmetrically around the selection, nearest units first
+            first, last = min(anchors), max(anchors)
+            for distance in range(1, neighbours + 1):
+                take(first - distance)
+                take(last + distance)
+
+        scores = self.score(f"{query} {selected_text}")
+        for index in sorted(scores, key=scores.get, reverse=True):
+            take(index)
+            if budget - used < 16:
+                break
+
+        if budget - used >= 16:
+            # Little or nothing matched, as when the question is in the user's
+            # language and the transcript in the one they're learning: spend the
+            # rest on a sample of the whole transcript
+            remaining = [index for index in range(len(self.units)) if index not in chosen]
+            cost = sum(estimate_tokens(self.units[index]) for index in remaining)
+            stride = max(math.ceil(cost / (budget - used)), 1)
+            for index in remaining[::stride]:
+                take(index)
+
+        return sorted(chosen)
+
+    def render(self, indices: List[int]) -> str:
+        """Join the chosen units in transcript order, marking gaps with an ellipsis"""
+        pieces, previous = [], None
+        for index in indices:
+            if previous is not None and index != previous + 1:
+                pieces.append("[...]")
+            pieces.append(self.units[index])
+            previous = index
+        return " ".join(pieces)
+
+
+def select_transcript_context(
+    transcript: str,
+    user_message: str,
+    selected_text: str = "",
+    segments: Optional[List[Dict]] = None,
+    budget: int = CHAT_CONTEXT_TOKEN_BUDGET,
+) -> Tuple[str, bool]:
+    """
+    Return (context, is_excerpt). Transcripts that fit the budget are returned whole;
+    longer ones are cut down to the parts around the selection and the parts most
+    relevant to the question, topped up with an even sample of the rest, so prompt
+    size stays roughly constant.
+    """
+    if estimate_tokens(transcript) <= budget:
+        return transcript, False
+
+    index = ContextIndex.from_transcript(transcript, segments)
+    if not index.units:
+        return transcript, False
+    return index.render(index.select(user_message, selected_text, budget)), True
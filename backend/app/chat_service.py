@@ -0,0 +1,111 @@
+# chat_service.py
+
+import json
+import time
+import asyncio
+import traceback
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from .openai_client import get_openai_client, openai_slot, openai_upstream
+from .chat_context import select_transcript_context
+from .metrics import timed, stage_duration
+
+CHAT_MODEL = "gpt-4o-mini"
+
+def build_chat_messages(
+    transcript: str,
+    user_message: str,
+    selected_text: str = "",
+    segments: Optional[List[Dict]] = None,
+) -> List[Dict]:
+    """
+    Build the message list for a question about a transcript.
+    
+    Long transcripts are cut down to the excerpts relevant to this question (see
+    chat_context), so the prompt stays within CHAT_CONTEXT_TOKEN_BUDGET.
+    """
+    context, is_excerpt = select_transcript_context(transcript, user_message, selected_text, segments)
+    
+    # Prepare system message with transcript and highlight selected text if available
+    if is_excerpt:
+        system_message = f"You are a language learning teacher helping the user to improve their target language by talking to them about this text. These are the excerpts most relevant to the user's question, with gaps marked [...]: {context} The text is in their target language. The text is a transcript of some audio or video content that they are using to study. Your only role is to help the user to improve in their target language, you cannot help with anything that is unrelated to this role."
+    else:
+        system_message = f"You are a language learning teacher helping the user to improve their target language by talking to them about this text: {context} which is in their target language. The text is a transcript of some audio or video content that they are using to study. Your only role is to help the user to improve in their target language, you cannot help with anything that is unrelated to this role."
+    
+    # Add context about the selected text if it exists
+    messages = [{"role": "system", "content": system_message}]
+    
+    if selected_text:
+        messages.append(selected_text_message(selected_text))
+    
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+def selected_text_message(selected_text: str) -> Dict:
+    return {"role": "system", "content": f"The user has selected/highlighted this specific part of the text: \"{selected_text}\". They may be asking about this particular section."}
+
+async def complete_chat(messages: List[Dict]) -> str:
+    """Run a chat completion and return the assistant's reply"""
+    async with openai_slot(CHAT_MODEL):
+        with timed("chat_completion"):
+            response = await openai_upstream.call(lambda: get_openai_client().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+            ))
+    print("OpenAI Response:", response)
+    # Extract the chatbot's response
+    return response.choices[0].message.content
+
+def _sse(data: Dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def stream_chat(
+    messages: List[Dict],
+    on_complete: Optional[Callable[[str], None]] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream a chat completion as server-sent events.
+    
+    Each token is sent as `data: {"token": ...}` as soon as it arrives, followed by
+    an `event: done` (or `event: error`) message. If the client disconnects, the
+    generator is cancelled and the upstream stream is closed so we stop paying for
+    tokens nobody will read. `on_complete` receives the full reply once the stream
+    finishes successfully.
+    """
+    async with openai_slot(CHAT_MODEL):
+        started = time.perf_counter()
+        try:
+            # Only opening the stream is retried; once tokens flow we can't replay them
+            stream = await openai_upstream.call(lambda: get_openai_client().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                stream=True,
+            ))
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            yield _sse({"detail": f"Chatbot error: {str(e)}"}, event="error")
+            return
+        
+        tokens = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    if not tokens:
+                        stage_duration.observe(time.perf_counter() - started, stage="chat_first_token")
+                    tokens.append(token)
+                    yield _sse({"token": token})
+            stage_duration.observe(time.perf_counter() - started, stage="chat_stream")
+            if on_complete:
+                on_complete("".join(tokens))
+            yield _sse({}, event="done")
+        except asyncio.CancelledError:
+            print("Chat stream cancelled by client")
+            raise
+        except Exception as e:
+            print(traceback.format_exc())
+            yield _sse({"detail": f"Chatbot error: {str(e)}"}, event="error")
+        finally:
+            await stream.response.aclose()
@@ -0,0 +1,127 @@
+# chat_sessions.py
+
+import os
+import uuid
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional
+from .cache import TTLCache
+from .chat_context import ContextIndex, estimate_tokens
+from .chat_service import selected_text_message
+from .supabase_client import get_supabase
+
+# Sessions idle for longer than this are dropped
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", 2 * 60 * 60))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", 1000))
+
+# Question/answer pairs of history kept per session
+CHAT_SESSION_MAX_TURNS = int(os.getenv("CHAT_SESSION_MAX_TURNS", 20))
+
+# Transcripts up to this size are put whole in the session's fixed prompt prefix;
+# longer ones get relevant excerpts per question instead
+CHAT_SESSION_PREFIX_TOKEN_BUDGET = int(os.getenv("CHAT_SESSION_PREFIX_TOKEN_BUDGET", 12000))
+CHAT_SESSION_EXCERPT_TOKEN_BUDGET = int(os.getenv("CHAT_SESSION_EXCERPT_TOKEN_BUDGET", 3000))
+
+TEACHER_INSTRUCTIONS = "The text is a transcript of some audio or video content that they are using to study. Your only role is to help the user to improve in their target language, you cannot help with anything that is unrelated to this role."
+
+
+class ChatSession:
+    """
+    Conversation state for one transcript.
+
+    Messages are laid out so the start of every request is byte-identical from
+    turn to turn: the system prompt (with the transcript when it fits), then the
+    history in order, and only then the parts that change per question. That
+    lets upstream prompt caching reuse the prefix.
+    """
+
+    def __init__(self, session_id: str, transcript: str, segments: Optional[List[Dict]] = None):
+        self.session_id = session_id
+        self.history = deque(maxlen=CHAT_SESSION_MAX_TURNS * 2)
+        self.index = None
+
+        if estimate_tokens(transcript) <= CHAT_SESSION_PREFIX_TOKEN_BUDGET:
+            system_message = f"You are a language learning teacher helping the user to improve their target language by talking to them about this text: {transcript} which is in their target language. {TEACHER_INSTRUCTIONS}"
+        else:
+            self.index = ContextIndex.from_transcript(transcript, segments)
+            system_message = f"You are a language learning teacher helping the user to improve their target language by talking to them about a text in their target language. The parts of the text relevant to each question are provided with it. {TEACHER_INSTRUCTIONS}"
+        self.prefix = [{"role": "system", "content": system_message}]
+
+    def build_messages(self, user_message: str, selected_text: str = "") -> List[Dict]:
+        messages = self.prefix + list(self.history)
+
+        if self.index is not None:
+            indices = self.index.select(user_message, selected_text, CHAT_SESSION_EXCERPT_TOKEN_BUDGET)
+            messages.append({
+                "role": "system",
+                "content": f"Excerpts of the text relevant to the next question, with gaps marked [...]: {self.index.render(indices)}",
+            })
+
+        if selected_text:
+            messages.append(selected_text_message(selected_text))
+
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def record_turn(self, user_message: str, reply: str):
+        self.history.append({"role": "user", "content": user_message})
+        self.history.append({"role": "assistant", "content": reply})
+
+
+sessions = TTLCache(CHAT_SESSION_MAX, CHAT_SESSION_TTL_SECONDS)
+
+
+def create_session(transcript: str, segments: Optional[List[Dict]] = None) -> ChatSession:
+    session = ChatSession(str(uuid.uuid4()), transcript, segments)
+    sessions.set(session.session_id, session)
+    return session
+
+
+def get_session(session_id: str) -> Optional[ChatSession]:
+    session = sessions.get(session_id)
+    if session is not None:
+        # Re-insert to push the expiry back; sessions expire after inactivity
+        sessions.set(session_id, session)
+    return session
+
+
+def delete_session(session_id: str):
+    sessions.pop(session_id)
+
+
+class NotAuthenticated(Exception):
+    """The caller's Supabase access token is missing or invalid"""
+
+
+async def load_stored_transcript(transcript_id: str, access_token: Optional[str]) -> Optional[str]:
+    """
+    Fetch the text of a transcript the caller owns from the Supabase `transcripts` table.
+
+    We query with the service key, which bypasses row level security, so the
+    caller's access token is verified first and the row is filtered on its
+    user_id, the same as lib/transcriptUtils.ts does in the frontend.
+    """
+    if not access_token:
+        raise NotAuthenticated("Sign in to chat about a saved transcript")
+
+    def query():
+        try:
+            user = get_supabase().auth.get_user(access_token).user
+        except Exception:
+            user = None
+        if user is None:
+            raise NotAuthenticated("Invalid or expired access token")
+        return (
+            get_supabase().table("transcripts")
+            .select("transcript")
+            .eq("id", transcript_id)
+            .eq("user_id", user.id)
+            .limit(1)
+            .execute()
+        )
+
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(None, query)
+    if not response.data:
+        return None
+    return response.data[0]["transcript"]
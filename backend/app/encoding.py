@@ -0,0 +1,111 @@
+# encoding.py
+
+import os
+import gzip
+import json
+import asyncio
+from typing import Any, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from .segments import SegmentStore
+
+# Optional accelerators: orjson for JSON, brotli for `br` responses, msgpack for
+# the binary format. Without them we fall back to the standard library / gzip / JSON.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Bodies smaller than this are sent uncompressed; it isn't worth the CPU
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+# 4-5 compresses transcripts close to gzip -9 at a fraction of the cost of 11
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def _default(obj: Any):
+    if isinstance(obj, SegmentStore):
+        return obj.to_list()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact JSON; understands SegmentStore"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _accepts(header: str, token: str) -> bool:
+    """Whether an Accept / Accept-Encoding header allows `token` (q=0 means no)"""
+    for part in header.lower().split(","):
+        name, *params = [piece.strip() for piece in part.split(";")]
+        if name != token:
+            continue
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def wants_msgpack(request: Request) -> bool:
+    if msgpack is None:
+        return False
+    if request.query_params.get("format") == "msgpack":
+        return True
+    accept = request.headers.get("accept", "")
+    return any(_accepts(accept, media_type) for media_type in MSGPACK_TYPES)
+
+
+def _encode(body: Any, use_msgpack: bool, accept_encoding: str) -> Tuple[bytes, str, str]:
+    if use_msgpack:
+        content = msgpack.packb(body, default=_default, use_bin_type=True)
+        media_type = "application/msgpack"
+    else:
+        content = dumps(body)
+        media_type = "application/json"
+
+    content_encoding = None
+    if len(content) >= COMPRESS_MIN_BYTES:
+        if brotli is not None and _accepts(accept_encoding, "br"):
+            content = brotli.compress(content, quality=BROTLI_QUALITY)
+            content_encoding = "br"
+        elif _accepts(accept_encoding, "gzip"):
+            content = gzip.compress(content, compresslevel=GZIP_LEVEL)
+            content_encoding = "gzip"
+    return content, media_type, content_encoding
+
+
+async def transcript_response(request: Request, body: Any, status_code: int = 200) -> Response:
+    """
+    Encode a transcript-sized response body.
+
+    Sends msgpack when the client asks for it (Accept: application/msgpack or
+    ?format=msgpack), JSON otherwise, compressed with brotli or gzip according to
+    Accept-Encoding. Encoding runs in a thread so a multi-megabyte transcript
+    doesn't stall the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    content, media_type, content_encoding = await loop.run_in_executor(
+        None, _encode, body, wants_msgpack(request), request.headers.get("accept-encoding", "")
+    )
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content, status_code=status_code, headers=headers, media_type=media_type)
@@ -0,0 +1,87 @@
+# http_client.py
+
+import os
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import httpx
+
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "True").lower() == "true"
+
+# Default timeouts for outbound calls; individual calls can override them
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+
+# Connection limits for hosts without their own pool below
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 50))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+
+# Each upstream gets its own pool so a burst against one can't starve the others.
+# env prefix -> (base URL env var, default base URL, default max connections)
+UPSTREAM_POOLS = {
+    "OPENAI": ("OPENAI_BASE_URL", "https://api.openai.com/v1", 32),
+    "SUPABASE": ("SUPABASE_URL", None, 32),
+    "YOUTUBE_TRANSCRIPT": ("YOUTUBE_TRANSCRIPT_API_URL", "https://www.youtube-transcript.io/api/transcripts", 8),
+}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _transport(max_connections: int, max_keepalive: int) -> httpx.AsyncHTTPTransport:
+    return httpx.AsyncHTTPTransport(
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def _upstream_mounts() -> Dict[str, httpx.AsyncHTTPTransport]:
+    mounts = {}
+    for prefix, (url_env, default_url, default_connections) in UPSTREAM_POOLS.items():
+        base_url = os.getenv(url_env, default_url)
+        if not base_url:
+            continue
+        parsed = urlparse(base_url)
+        max_connections = int(os.getenv(f"{prefix}_MAX_CONNECTIONS", default_connections))
+        mounts[f"{parsed.scheme}://{parsed.netloc}"] = _transport(
+            max_connections, min(max_connections, HTTP_MAX_KEEPALIVE)
+        )
+    return mounts
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the application-wide async HTTP client.
+
+    All outbound calls share it so connections (and their TLS sessions) are kept
+    alive and reused across requests. Created on first use and closed by the
+    application lifespan.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            timeout=httpx.Timeout(
+                HTTP_READ_TIMEOUT,
+                connect=HTTP_CONNECT_TIMEOUT,
+                pool=HTTP_POOL_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            mounts=_upstream_mounts(),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
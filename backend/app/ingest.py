@@ -0,0 +1,174 @@
+# ingest.py
+
+import os
+import uuid
+import asyncio
+import traceback
+from typing import Awaitable, Callable, Dict, List, Optional
+from .utils import guess_content_type, upload_to_storage, public_url
+from .transcoding import prepare_audio
+from .transcript_cache import transcript_cache
+from .whisper_service import transcribe_audio
+from .metrics import timed
+from .segments import SegmentStore
+from .transcript_store import SEGMENT_PAGE_SIZE, put_transcript, upload_transcript_id
+from .websockets import manager
+
+StageCallback = Callable[[str], Awaitable[None]]
+
+
+async def _enter_stage(on_stage: Optional[StageCallback], stage: str):
+    if on_stage:
+        await on_stage(stage)
+
+
+async def _store(audio_path: str, filename: str, content_type: str) -> str:
+    print(f"Uploading file with content type: {content_type}")
+    await upload_to_storage(audio_path, filename, content_type)
+    print(f"File uploaded to Supabase: {filename}")
+    return public_url(filename)
+
+
+def _segment_streamer(client_id: str, transcript_id: str):
+    """Callback that pushes finished segments to the client's JSON websocket"""
+    async def send_segments(first_index: int, segments: List[Dict]):
+        await manager.send_event({
+            "type": "segments",
+            "transcriptId": transcript_id,
+            # Lets the client spot a gap and fill it from /transcripts/{id}/segments/page
+            "firstIndex": first_index,
+            "segments": segments,
+        }, client_id)
+    return send_segments
+
+
+async def _stream_cached(client_id: str, transcript_id: str, segments: SegmentStore):
+    send_segments = _segment_streamer(client_id, transcript_id)
+    for first_index in range(0, len(segments), SEGMENT_PAGE_SIZE):
+        last_index = min(first_index + SEGMENT_PAGE_SIZE, len(segments))
+        await send_segments(first_index, [segments[index] for index in range(first_index, last_index)])
+
+
+def _completion(transcript_id: str, segment_count: int, audio_url: Optional[str]) -> Dict:
+    return {
+        "transcriptId": transcript_id,
+        "segmentCount": segment_count,
+        "audioUrl": audio_url,
+        "streamed": True,
+    }
+
+
+async def process_upload(
+    spooled_path: str,
+    content_hash: str,
+    file_extension: str,
+    content_type: str = None,
+    client_id: str = None,
+    on_stage: Optional[StageCallback] = None,
+    stream_segments: bool = False,
+    raise_errors: bool = False,
+) -> Dict:
+    """
+    Run a spooled upload through the ingest pipeline: cache lookup, transcode,
+    then store and transcribe at the same time.
+
+    Transcription reads the local copy, so the audio is never downloaded back
+    from storage. If the storage write fails the transcript is still returned,
+    with "audioUrl" set to None and the reason in "storageError".
+
+    Used both by /upload/ and by upload jobs. `on_stage` is awaited with the name
+    of each stage as it starts. The spooled file is removed once it is no longer
+    needed.
+
+    With `stream_segments`, segments are pushed to the client's websocket (JSON
+    format only) as {"type": "segments", ...} events while transcription runs,
+    and the return value only confirms completion.
+
+    Transcription failures come back as the error text with no segments, unless
+    `raise_errors` is set (jobs use it so the job is marked failed).
+
+    Returns:
+        The response body: {"transcript", "segments", "audioUrl"} (+ "storageError"),
+        or {"transcriptId", "segmentCount", "audioUrl", "streamed"} when streaming
+    """
+    transcript_id = upload_transcript_id(content_hash)
+    stream_segments = stream_segments and bool(client_id)
+    try:
+        # Identical content was transcribed before: skip storage and Whisper
+        with timed("transcript_cache_lookup"):
+            cached = await transcript_cache.get(content_hash)
+        if cached:
+            print(f"Transcript cache hit: {content_hash}")
+            put_transcript(transcript_id, cached["segments"])
+            if stream_segments and cached["segments"]:
+                await _stream_cached(client_id, transcript_id, cached["segments"])
+                return _completion(transcript_id, len(cached["segments"]), cached["audio_url"])
+            return {
+                "transcript": cached["text"], 
+                "segments": cached["segments"],
+                "audioUrl": cached["audio_url"],
+                "transcriptId": transcript_id
+            }
+        
+        # Step 1: Reduce the upload to compact audio
+        await _enter_stage(on_stage, "transcode")
+        content_type = content_type or guess_content_type(file_extension)
+        audio_path, transcoded_type = await prepare_audio(spooled_path)
+        if transcoded_type:
+            content_type = transcoded_type
+            file_extension = os.path.splitext(audio_path)[1]
+        
+        # Step 2: Save the audio to Supabase in the background...
+        filename = f"{uuid.uuid4()}{file_extension}"
+        store_task = asyncio.create_task(_store(audio_path, filename, content_type))
+        try:
+            # Step 3: ...while Whisper transcribes the same local file
+            await _enter_stage(on_stage, "transcribe")
+            transcript_data = await transcribe_audio(
+                audio_path,
+                client_id,
+                prepared=True,
+                raise_errors=raise_errors,
+                on_segments=_segment_streamer(client_id, transcript_id) if stream_segments else None,
+            )
+            
+            if not store_task.done():
+                await _enter_stage(on_stage, "store")
+            file_url, storage_error = None, None
+            try:
+                file_url = await store_task
+            except Exception as e:
+                print(traceback.format_exc())
+                storage_error = f"Audio could not be saved: {str(e)}"
+        finally:
+            # Both readers must be finished before the local audio is removed
+            if not store_task.done():
+                store_task.cancel()
+            await asyncio.gather(store_task, return_exceptions=True)
+            if audio_path != spooled_path and os.path.exists(audio_path):
+                os.remove(audio_path)
+    finally:
+        if os.path.exists(spooled_path):
+            os.remove(spooled_path)
+    
+    # transcribe_audio reports failures as text with no segments; don't cache
+    # those, or anything without stored audio to point at
+    if transcript_data["segments"] and file_url:
+        await transcript_cache.put(content_hash, transcript_data, file_url)
+    
+    segments = SegmentStore.from_segments(transcript_data["segments"])
+    response = {
+        "transcript": transcript_data["text"], 
+        "segments": segments,
+        "audioUrl": file_url  # Still return audio URL for uploaded files
+    }
+    if segments:
+        # Lets the player page through segments via /transcripts/{id}/...
+        put_transcript(transcript_id, segments)
+        response["transcriptId"] = transcript_id
+        if stream_segments:
+            # The client already has every segment; failures still get the full body
+            response = _completion(transcript_id, len(segments), file_url)
+    if storage_error:
+        response["storageError"] = storage_error
+    return response
@@ -0,0 +1,292 @@
+# jobs.py
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Optional
+from .encoding import dumps
+from .websockets import manager, progress_job_id
+
+# Number of jobs processed concurrently by this worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+
+# Submissions are refused once this many jobs are waiting
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", 100))
+
+# Queued or running jobs allowed per client at once
+JOB_MAX_PER_CLIENT = int(os.getenv("JOB_MAX_PER_CLIENT", 3))
+
+# Finished jobs are kept this long for GET /jobs/{id}
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 24 * 60 * 60))
+
+# Job records live in SQLite so any worker process can answer status requests
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "storage/jobs.sqlite3")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobRejected(Exception):
+    """Raised when a job can't be admitted; `status_code` says why (429 or 503)"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JobStore:
+    """SQLite-backed job records: status, current stage, result and error"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    client_id TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection = connection
+        return self._connection
+
+    def create(self, job_id: str, kind: str, client_id: Optional[str]):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT INTO jobs (id, kind, client_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, client_id, QUEUED, now, now),
+            )
+            connection.commit()
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = dumps(fields["result"]).decode("utf-8")
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+            connection.commit()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT id, kind, status, stage, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, status, stage, result, error, created_at, updated_at = row
+        return {
+            "jobId": job_id,
+            "kind": kind,
+            "status": status,
+            "stage": stage,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "createdAt": created_at,
+            "updatedAt": updated_at,
+        }
+
+    def purge(self, older_than: float):
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (SUCCEEDED, FAILED, older_than),
+            )
+            connection.commit()
+
+
+JobHandler = Callable[[Dict[str, Any], "JobContext"], Awaitable[Any]]
+
+
+class JobContext:
+    """Handed to job handlers so they can report which stage they are in"""
+
+    def __init__(self, queue: "JobQueue", job_id: str, client_id: Optional[str]):
+        self.queue = queue
+        self.job_id = job_id
+        self.client_id = client_id
+
+    async def set_stage(self, stage: str):
+        await self.queue._update(self.job_id, self.client_id, status=RUNNING, stage=stage)
+
+
+class JobQueue:
+    """
+    In-process job queue with a fixed pool of worker tasks.
+
+    Submitting returns immediately with a job id; workers pick jobs off the queue
+    and run the handler registered for the job's kind. Admission is refused when
+    the queue is full or the client already has too many jobs in flight.
+    """
+
+    def __init__(self, store: JobStore, workers: int, max_depth: int, max_per_client: int):
+        self.store = store
+        self.workers = max(workers, 1)
+        self.max_depth = max(max_depth, 1)
+        self.max_per_client = max(max_per_client, 1)
+        self._handlers: Dict[str, JobHandler] = {}
+        self._cleanups: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._per_client: Dict[str, int] = {}
+        # Jobs admitted by submit() but not yet recorded and queued
+        self._reserved = 0
+        self._running = 0
+
+    def register(self, kind: str, handler: JobHandler, cleanup: Callable[[Dict[str, Any]], None] = None):
+        """
+        Register the coroutine that runs jobs of `kind`. `cleanup` is called with
+        the payload of jobs that are dropped without running (e.g. on shutdown).
+        """
+        self._handlers[kind] = handler
+        if cleanup:
+            self._cleanups[kind] = cleanup
+
+    def _get_queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    def depth(self) -> int:
+        return (self._queue.qsize() if self._queue else 0) + self._reserved
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self.depth(),
+            "running": self._running,
+            "workers": self.workers,
+        }
+
+    async def start(self):
+        queue = self._get_queue()
+        self._tasks = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Release resources held by jobs that never ran
+        queue = self._get_queue()
+        while not queue.empty():
+            job_id, kind, payload, client_id = queue.get_nowait()
+            self._run_cleanup(kind, payload)
+            self.store.update(job_id, status=FAILED, error="Server shut down before the job ran")
+
+    async def submit(self, kind: str, payload: Dict[str, Any], client_id: Optional[str] = None) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        if self.depth() >= self.max_depth:
+            raise JobRejected("Too many jobs are waiting. Please try again shortly.", 503)
+        if client_id and self._per_client.get(client_id, 0) >= self.max_per_client:
+            raise JobRejected("You already have too many jobs in progress.", 429)
+
+        # Claim the slot before awaiting, or concurrent submits would all pass the checks
+        self._reserved += 1
+        if client_id:
+            self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+
+        job_id = str(uuid.uuid4())
+
+        def record():
+            self.store.purge(time.time() - JOB_RETENTION_SECONDS)
+            self.store.create(job_id, kind, client_id)
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, record)
+        except BaseException:
+            self._release_client(client_id)
+            raise
+        finally:
+            self._reserved -= 1
+        self._get_queue().put_nowait((job_id, kind, payload, client_id))
+        return job_id
+
+    def _release_client(self, client_id: Optional[str]):
+        if not client_id:
+            return
+        remaining = self._per_client.get(client_id, 1) - 1
+        if remaining > 0:
+            self._per_client[client_id] = remaining
+        else:
+            self._per_client.pop(client_id, None)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.store.get, job_id)
+
+    async def _update(self, job_id: str, client_id: Optional[str], **fields):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: self.store.update(job_id, **fields))
+        if client_id:
+            event = {"type": "job", "jobId": job_id}
+            event.update({key: value for key, value in fields.items() if key in ("status", "stage", "error")})
+            await manager.send_event(event, client_id)
+
+    def _run_cleanup(self, kind: str, payload: Dict[str, Any]):
+        cleanup = self._cleanups.get(kind)
+        if cleanup:
+            try:
+                cleanup(payload)
+            except Exception:
+                print(traceback.format_exc())
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job_id, kind, payload, client_id = await queue.get()
+            token = progress_job_id.set(job_id)
+            self._running += 1
+            try:
+                await self._update(job_id, client_id, status=RUNNING)
+                result = await self._handlers[kind](payload, JobContext(self, job_id, client_id))
+                await self._update(job_id, client_id, status=SUCCEEDED, stage=None, result=result)
+            except asyncio.CancelledError:
+                self._run_cleanup(kind, payload)
+                self.store.update(job_id, status=FAILED, error="Server shut down while the job was running")
+                raise
+            except Exception as e:
+                print(traceback.format_exc())
+                self._run_cleanup(kind, payload)
+                await self._update(job_id, client_id, status=FAILED, error=str(e))
+            finally:
+                self._running -= 1
+                progress_job_id.reset(token)
+                self._release_client(client_id)
+                queue.task_done()
+
+
+job_queue = JobQueue(JobStore(JOB_DB_PATH), JOB_WORKERS, JOB_QUEUE_MAX_DEPTH, JOB_MAX_PER_CLIENT)
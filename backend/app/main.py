@@ -1,13 +1,35 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
+import time
 from .routes import router
-from .websockets import router as websocket_router
+from .websockets import router as websocket_router, manager
+from .jobs import job_queue
+from .resources import resources
+from .transcript_cache import transcript_cache
+from .chat_sessions import sessions as chat_sessions
+from . import youtube_transcript_service
+from . import stt
+from .openai_client import openai_upstream
+from .metrics import request_duration, register_gauges, render_metrics, start_profiler, save_profile
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients are created here, not at import, so importing the app stays cheap
+    await resources.start()
+    app.state.resources = resources
+    yield
+    await resources.stop()
+
 
 app = FastAPI(
     title="Language Learning Transcriber",
     description="Upload audio/video files for transcription with language learning tools",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Get allowed origins from environment or use default values
@@ -28,6 +50,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Queue, connection and cache sizes are read on each /metrics scrape
+register_gauges("websocket", manager.stats)
+register_gauges("jobs", job_queue.stats)
+register_gauges("upload_cache", transcript_cache.stats)
+register_gauges("youtube_cache", youtube_transcript_service.transcript_cache.stats)
+register_gauges("youtube_singleflight", youtube_transcript_service.transcript_requests.stats)
+register_gauges("youtube_batcher", youtube_transcript_service.transcript_batcher.stats)
+register_gauges("chat_sessions", chat_sessions.stats)
+register_gauges("upstream_openai", openai_upstream.stats)
+register_gauges("upstream_youtube_transcript", youtube_transcript_service.youtube_upstream.stats)
+register_gauges("stt", stt.stats)
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    profiler = start_profiler()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not the raw path, so ids don't explode the series count
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        request_duration.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=path,
+            status=str(status),
+        )
+        if profiler:
+            save_profile(profiler, f"{request.method}{path.replace('/', '_')}")
+
 # Include the API routes
 app.include_router(router)
 
@@ -37,4 +93,18 @@ app.include_router(websocket_router)
 # Add a simple health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+# Readiness: 503 until every dependency has been warmed up
+@app.get("/ready")
+async def readiness_check():
+    status_code = 200 if resources.ready else 503
+    return JSONResponse(
+        {"status": "ready" if resources.ready else "starting", "checks": resources.checks},
+        status_code=status_code,
+    )
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,183 @@
+# metrics.py
+
+import os
+import time
+import random
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Stages slower than this are logged with their duration; everything else only
+# goes into the histograms
+SLOW_STAGE_SECONDS = float(os.getenv("SLOW_STAGE_SECONDS", 10))
+
+# Bucket upper bounds in seconds; stages range from cache lookups to hour-long Whisper runs
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Fraction of HTTP requests run under the sampling profiler (needs pyinstrument)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "storage/profiles")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout"""
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+stage_duration = Histogram("lingoscribe_stage_duration_seconds", "Time spent in each pipeline stage")
+stage_errors = Counter("lingoscribe_stage_errors_total", "Pipeline stages that raised")
+request_duration = Histogram("lingoscribe_http_request_duration_seconds", "HTTP request latency by route")
+
+_metrics = [stage_duration, stage_errors, request_duration]
+_gauge_sources: Dict[str, Callable[[], Dict]] = {}
+
+
+def register_metric(metric):
+    """Add a Counter or Histogram defined elsewhere to the /metrics output"""
+    _metrics.append(metric)
+    return metric
+
+
+def register_gauges(prefix: str, source: Callable[[], Dict]):
+    """
+    Export the numeric values of `source()` (e.g. a cache's stats()) as gauges
+    named lingoscribe_<prefix>_<key>, read each time /metrics is scraped.
+    """
+    _gauge_sources[prefix] = source
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time the enclosed block as `stage`.
+
+    Costs two clock reads and a dict update, so it is fine to leave around hot
+    paths. Failures are counted separately and still recorded in the histogram.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(elapsed, stage=stage)
+        if elapsed >= SLOW_STAGE_SECONDS:
+            print(f"Slow stage {stage}: {elapsed:.2f}s")
+
+
+def _snake_case(name: str) -> str:
+    return "".join(f"_{char.lower()}" if char.isupper() else char for char in name)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for prefix, source in _gauge_sources.items():
+        try:
+            values = source()
+        except Exception as e:
+            print(f"Could not collect {prefix} metrics: {e}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"lingoscribe_{prefix}_{_snake_case(key)}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def start_profiler():
+    """
+    Return a running pyinstrument profiler for a sampled fraction of requests,
+    or None. Profiling is off unless PROFILE_SAMPLE_RATE is set and pyinstrument
+    is installed.
+    """
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    profiler = Profiler(async_mode="enabled")
+    profiler.start()
+    return profiler
+
+
+def save_profile(profiler, name: str):
+    profiler.stop()
+    os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_OUTPUT_DIR, f"{int(time.time() * 1000)}-{name}.html")
+    with open(path, "w") as f:
+        f.write(profiler.output_html())
+    print(f"Saved request profile to {path}")
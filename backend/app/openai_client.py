@@ -0,0 +1,73 @@
+# openai_client.py
+
+import os
+import asyncio
+from typing import TYPE_CHECKING, Dict, Optional
+from .http_client import get_http_client
+from .resilience import Failure, Upstream, classify_httpx_error, classify_status
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# Default cap on concurrent requests per model; override a single model with
+# OPENAI_CONCURRENCY_<MODEL>, e.g. OPENAI_CONCURRENCY_WHISPER_1=8
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 16))
+
+_client: Optional["AsyncOpenAI"] = None
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_openai_client() -> "AsyncOpenAI":
+    """
+    Return the async OpenAI client shared by transcription and chat.
+
+    It sends requests over the application's pooled HTTP client, so awaiting a
+    completion never ties up a thread or blocks the event loop.
+    """
+    global _client
+    if _client is None:
+        # Imported here: the openai package is slow to import and not needed until the first call
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=get_http_client(),
+            # Retries are done by openai_upstream so they share its backoff and breaker
+            max_retries=0,
+        )
+    return _client
+
+
+def classify_openai_error(error: Exception) -> Optional[Failure]:
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        return classify_status(error.status_code, error.response.headers)
+    if isinstance(error, openai.APITimeoutError):
+        return Failure("timeout")
+    if isinstance(error, openai.APIConnectionError):
+        return Failure("connection")
+    return classify_httpx_error(error)
+
+
+# Shared by transcription and chat; wrap each request as
+# `await openai_upstream.call(lambda: client....create(...))`
+openai_upstream = Upstream.from_env("openai", "OPENAI", rate=20, burst=20, classify=classify_openai_error)
+
+
+def concurrency_limit(model: str) -> int:
+    env_name = "OPENAI_CONCURRENCY_" + "".join(
+        char if char.isalnum() else "_" for char in model.upper()
+    )
+    return int(os.getenv(env_name, OPENAI_MAX_CONCURRENCY))
+
+
+def openai_slot(model: str) -> asyncio.Semaphore:
+    """
+    Semaphore bounding in-flight requests to one model. Use as
+    `async with openai_slot("whisper-1"): ...`
+    """
+    semaphore = _semaphores.get(model)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(concurrency_limit(model), 1))
+        _semaphores[model] = semaphore
+    return semaphore
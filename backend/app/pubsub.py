@@ -0,0 +1,163 @@
+# pubsub.py
+
+import os
+import json
+import asyncio
+import traceback
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, Optional
+
+# Where progress events are published so every worker process sees them.
+# "memory://" (default) only reaches sockets in this process; use a
+# redis:// URL when running uvicorn with several workers.
+PROGRESS_BACKPLANE_URL = os.getenv("PROGRESS_BACKPLANE_URL", "memory://")
+PROGRESS_CHANNEL = os.getenv("PROGRESS_CHANNEL", "lingoscribe:progress")
+
+# Backoff between attempts to resubscribe after the Redis connection drops
+PROGRESS_RECONNECT_BASE_DELAY = float(os.getenv("PROGRESS_RECONNECT_BASE_DELAY", 0.5))
+PROGRESS_RECONNECT_MAX_DELAY = float(os.getenv("PROGRESS_RECONNECT_MAX_DELAY", 30))
+
+# Events waiting to be published to Redis; beyond this the oldest are dropped
+# rather than holding up the job that produced them
+PROGRESS_PUBLISH_QUEUE_MAX = int(os.getenv("PROGRESS_PUBLISH_QUEUE_MAX", 1000))
+
+Deliver = Callable[[str, Dict], Awaitable[None]]
+
+
+class ProgressBackplane(ABC):
+    """
+    Fan-out of progress events between worker processes.
+
+    `publish` sends an event for a client id; every subscribed worker receives it
+    through the `deliver` callback given to `start`, and delivers it only if it
+    holds that client's websocket. Progress is best effort: `publish` must not
+    wait on the network or raise because the backplane is unavailable.
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Deliver):
+        ...
+
+    @abstractmethod
+    async def publish(self, client_id: str, event: Dict):
+        ...
+
+    async def stop(self):
+        pass
+
+
+class InMemoryBackplane(ProgressBackplane):
+    """Single-process backplane: publishing delivers straight to local sockets"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def publish(self, client_id: str, event: Dict):
+        if self._deliver:
+            await self._deliver(client_id, event)
+
+
+class RedisBackplane(ProgressBackplane):
+    """
+    Backplane over Redis pub/sub (or anything speaking the Redis protocol, such
+    as a local redis-server or KeyDB during tests).
+
+    Published events are queued and sent by a background task, so a slow or
+    unreachable Redis only costs dropped progress. `client` replaces the
+    connection made from `url`, e.g. with a fake in tests.
+    """
+
+    def __init__(self, url: str, channel: str = PROGRESS_CHANNEL, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise Exception("The redis package is required for a redis:// PROGRESS_BACKPLANE_URL")
+            client = redis.from_url(url)
+        self.channel = channel
+        self.dropped = 0
+        self._redis = client
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._publisher: Optional[asyncio.Task] = None
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=PROGRESS_PUBLISH_QUEUE_MAX)
+
+    async def start(self, deliver: Deliver):
+        self._publisher = asyncio.create_task(self._publish_loop())
+        try:
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(self.channel)
+        except Exception as e:
+            # The listener keeps retrying; the app can serve in the meantime
+            print(f"Progress backplane could not subscribe to Redis ({e})")
+            self._pubsub = None
+        self._listener = asyncio.create_task(self._listen(deliver))
+
+    async def _listen(self, deliver: Deliver):
+        """
+        Deliver messages until stopped. If the connection drops, log it and
+        resubscribe with backoff; otherwise cross-worker progress would stop for good.
+        """
+        delay = PROGRESS_RECONNECT_BASE_DELAY
+        while True:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                    await self._pubsub.subscribe(self.channel)
+                    print("Progress backplane resubscribed to Redis")
+                    delay = PROGRESS_RECONNECT_BASE_DELAY
+                async for message in self._pubsub.listen():
+                    try:
+                        envelope = json.loads(message["data"])
+                        await deliver(envelope["clientId"], envelope["event"])
+                    except Exception:
+                        print(traceback.format_exc())
+                raise Exception("subscription ended")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Progress backplane lost its Redis subscription ({e}); retrying in {delay:.1f}s")
+                pubsub, self._pubsub = self._pubsub, None
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, PROGRESS_RECONNECT_MAX_DELAY)
+
+    async def publish(self, client_id: str, event: Dict):
+        if self._outbox.full():
+            self._outbox.get_nowait()
+            self.dropped += 1
+        self._outbox.put_nowait(json.dumps({"clientId": client_id, "event": event}))
+
+    async def _publish_loop(self):
+        while True:
+            message = await self._outbox.get()
+            try:
+                await self._redis.publish(self.channel, message)
+            except Exception as e:
+                self.dropped += 1
+                print(f"Progress backplane could not publish to Redis: {e}")
+
+    async def stop(self):
+        for task in (self._listener, self._publisher):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self._pubsub:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.close()
+        await self._redis.close()
+
+
+def create_backplane(url: str = PROGRESS_BACKPLANE_URL) -> ProgressBackplane:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackplane(url)
+    if url.startswith("memory://"):
+        return InMemoryBackplane()
+    raise ValueError(f"Unsupported PROGRESS_BACKPLANE_URL: {url}")
@@ -0,0 +1,285 @@
+# resilience.py
+
+import os
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import httpx
+from .metrics import Counter, register_metric
+
+# Backoff between attempts: full jitter over base * 2^attempt, capped at RETRY_MAX_DELAY.
+# A Retry-After longer than RETRY_MAX_WAIT is not waited out; the call fails instead.
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 10))
+RETRY_MAX_WAIT = float(os.getenv("RETRY_MAX_WAIT", 30))
+
+upstream_calls = register_metric(Counter("lingoscribe_upstream_calls_total", "Outbound calls by upstream and outcome"))
+upstream_retries = register_metric(Counter("lingoscribe_upstream_retries_total", "Retried outbound calls by upstream and reason"))
+upstream_throttled = register_metric(Counter("lingoscribe_upstream_throttled_seconds_total", "Time spent waiting on upstream rate limits"))
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while its circuit breaker is open"""
+
+
+class RetryableStatus(Exception):
+    """Raised by a request function for a response worth retrying (429 or 5xx)"""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+        self.status_code = response.status_code
+
+
+class Failure:
+    """How a failed attempt should be handled"""
+
+    def __init__(self, reason: str, retry_after: Optional[float] = None, trips_breaker: bool = True):
+        self.reason = reason
+        self.retry_after = retry_after
+        # Rate limiting means the upstream is busy, not down
+        self.trips_breaker = trips_breaker
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds, from either delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_status(status_code: int, headers=None) -> Optional[Failure]:
+    retry_after = parse_retry_after(headers.get("retry-after")) if headers is not None else None
+    if status_code == 429:
+        return Failure("rate_limited", retry_after, trips_breaker=False)
+    if status_code >= 500:
+        return Failure(f"http_{status_code}", retry_after)
+    return None
+
+
+def classify_httpx_error(error: Exception) -> Optional[Failure]:
+    if isinstance(error, RetryableStatus):
+        return classify_status(error.status_code, error.response.headers)
+    if isinstance(error, httpx.TimeoutException):
+        return Failure("timeout")
+    if isinstance(error, httpx.TransportError):
+        return Failure("connection")
+    return None
+
+
+def raise_for_retryable(response: httpx.Response) -> httpx.Response:
+    if classify_status(response.status_code) is not None:
+        raise RetryableStatus(response)
+    return response
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter whose rate adapts to the upstream.
+
+    Every call takes a token; tokens refill at `rate` per second up to `burst`.
+    When the upstream answers 429 the rate is halved, and each success earns a
+    little of it back (up to the configured rate), so bursts settle at whatever
+    the upstream currently tolerates.
+    """
+
+    def __init__(self, rate: float, burst: float, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns how long we waited"""
+        if self.max_rate <= 0:
+            return 0.0
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        waited = 0.0
+        # Callers queue on the lock so tokens are handed out in arrival order
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= 1
+        return waited
+
+    def on_rate_limited(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. After that one trial call is let through (half-open):
+    success closes the circuit again, failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        # The trial call ended without a verdict (cancelled, 4xx or 429);
+        # let the next caller try instead
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class Upstream:
+    """
+    Rate limit, retry and circuit breaking for one external service.
+
+    `call` runs a request function under all three. The function should raise for
+    failures (RetryableStatus for 429/5xx responses); `classify` decides which of
+    those exceptions are worth retrying.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        max_attempts: int,
+        failure_threshold: int,
+        reset_timeout: float,
+        classify: Callable[[Exception], Optional[Failure]] = classify_httpx_error,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_attempts = max(max_attempts, 1)
+        self.classify = classify
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, rate: float, burst: float, **kwargs) -> "Upstream":
+        """Settings can be overridden with <PREFIX>_RATE_PER_SECOND, _BURST, _MAX_ATTEMPTS, ..."""
+        return cls(
+            name,
+            rate=float(os.getenv(f"{prefix}_RATE_PER_SECOND", rate)),
+            burst=float(os.getenv(f"{prefix}_BURST", burst)),
+            max_attempts=int(os.getenv(f"{prefix}_MAX_ATTEMPTS", 4)),
+            failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET_SECONDS", 30)),
+            **kwargs,
+        )
+
+    def _backoff(self, attempt: int, failure: Failure) -> float:
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+        if failure.retry_after is not None:
+            delay = max(delay, failure.retry_after)
+        return delay
+
+    async def call(self, send: Callable[[], Awaitable[T]]) -> T:
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow():
+                upstream_calls.inc(upstream=self.name, outcome="rejected")
+                raise CircuitOpenError(f"{self.name} is unavailable right now. Please try again shortly.")
+
+            try:
+                # Inside the try: a caller cancelled while waiting for a token
+                # must still hand back a half-open trial
+                waited = await self.bucket.acquire()
+                if waited:
+                    upstream_throttled.inc(waited, upstream=self.name)
+                result = await send()
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                failure = self.classify(e)
+                if failure is None:
+                    # Not an upstream health problem (e.g. a 4xx); pass it straight on
+                    # without touching the consecutive-failure count
+                    self.breaker.release_trial()
+                    upstream_calls.inc(upstream=self.name, outcome="error")
+                    raise
+                if failure.trips_breaker:
+                    self.breaker.record_failure()
+                else:
+                    # Busy, not down: neither a failure nor proof of recovery
+                    self.breaker.release_trial()
+                if failure.reason == "rate_limited":
+                    self.bucket.on_rate_limited()
+
+                delay = self._backoff(attempt, failure)
+                if attempt == self.max_attempts or delay > RETRY_MAX_WAIT:
+                    upstream_calls.inc(upstream=self.name, outcome="failed")
+                    raise
+                upstream_retries.inc(upstream=self.name, reason=failure.reason)
+                print(f"{self.name} call failed ({failure.reason}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.bucket.on_success()
+            upstream_calls.inc(upstream=self.name, outcome="success")
+            return result
+
+    def stats(self) -> Dict:
+        return {
+            "breakerOpen": int(self.breaker.state == CircuitBreaker.OPEN),
+            "breakerHalfOpen": int(self.breaker.state == CircuitBreaker.HALF_OPEN),
+            "breakerTrips": self.breaker.times_opened,
+            "consecutiveFailures": self.breaker.failures,
+            "ratePerSecond": self.bucket.rate,
+        }
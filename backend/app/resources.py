@@ -0,0 +1,99 @@
+# resources.py
+
+import os
+import shutil
+import asyncio
+import traceback
+from typing import Callable, Dict, Optional
+from .http_client import get_http_client, close_http_client
+from .openai_client import get_openai_client
+from .supabase_client import get_supabase
+from .transcoding import TRANSCODE_WORKERS, get_process_pool, shutdown_process_pool
+from .stt import STT_BACKEND, local_backend, local_stt_enabled
+from .transcript_cache import transcript_cache
+from .websockets import manager
+from .jobs import job_queue
+
+PENDING = "pending"
+READY = "ready"
+
+
+def _check_ffmpeg():
+    missing = [tool for tool in ("ffmpeg", "ffprobe") if shutil.which(tool) is None]
+    if missing:
+        raise Exception(f"Not found on PATH: {', '.join(missing)}")
+
+
+def _warm_transcoder():
+    # Forks the transcode workers now rather than on the first upload
+    pool = get_process_pool()
+    for future in [pool.submit(os.getpid) for _ in range(max(TRANSCODE_WORKERS, 1))]:
+        future.result()
+
+
+# name -> blocking function that creates or checks the dependency
+WARMUPS: Dict[str, Callable[[], object]] = {
+    "openai": get_openai_client,
+    "supabase": get_supabase,
+    "ffmpeg": _check_ffmpeg,
+    "transcoder": _warm_transcoder,
+    "transcriptCache": transcript_cache.warm,
+}
+
+if STT_BACKEND == "local" or (local_stt_enabled() and local_backend.installed()):
+    # Starts the local STT workers, each loading its model once. Without
+    # faster-whisper auto mode uses the API, so there is nothing to warm
+    WARMUPS["localStt"] = local_backend.warm
+
+
+class Resources:
+    """
+    Clients and background services owned by the app's lifespan.
+
+    Nothing is created at import time. `start` brings up what requests need
+    immediately (the HTTP pool, websocket manager and job workers) and then warms
+    the slower dependencies in the background, so the server accepts connections
+    straight away and /ready reports when everything is warm.
+    """
+
+    def __init__(self):
+        self.checks: Dict[str, str] = {name: PENDING for name in WARMUPS}
+        self._warmup: Optional[asyncio.Task] = None
+
+    async def start(self):
+        get_http_client()
+        await manager.start()
+        await job_queue.start()
+        self._warmup = asyncio.create_task(self._warm())
+
+    async def _warm(self):
+        loop = asyncio.get_running_loop()
+
+        async def warm(name: str, function: Callable[[], object]):
+            try:
+                # Blocking imports, client construction and process forks stay off the event loop
+                await loop.run_in_executor(None, function)
+                self.checks[name] = READY
+            except Exception as e:
+                print(f"Warm-up of {name} failed: {e}")
+                print(traceback.format_exc())
+                self.checks[name] = f"error: {e}"
+
+        await asyncio.gather(*(warm(name, function) for name, function in WARMUPS.items()))
+
+    @property
+    def ready(self) -> bool:
+        return all(state == READY for state in self.checks.values())
+
+    async def stop(self):
+        if self._warmup:
+            self._warmup.cancel()
+            await asyncio.gather(self._warmup, return_exceptions=True)
+        await job_queue.stop()
+        await manager.stop()
+        await close_http_client()
+        shutdown_process_pool()
+        local_backend.shutdown()
+
+
+resources = Resources()
@@ -1,27 +1,73 @@
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, Request, UploadFile, File, HTTPException, Form, Header
+from fastapi.responses import StreamingResponse, JSONResponse
 from .youtube_transcript_service import process_youtube_video  # NEW: Import new service
-from .whisper_service import transcribe_audio  # Keep for audio file uploads
-from .utils import save_uploaded_file
+from . import youtube_transcript_service
+from .utils import spool_upload
+from .transcript_cache import transcript_cache
+from .ingest import process_upload
+from .jobs import job_queue, JobRejected
+from .encoding import transcript_response
 import os
-from openai import OpenAI
+from .chat_service import build_chat_messages, complete_chat, stream_chat
+from . import chat_sessions
+from . import transcript_store
 import traceback
 from pydantic import BaseModel
-import asyncio
+from typing import List, Optional
 
 router = APIRouter()
 
 class YouTubeRequest(BaseModel):
     url: str
     client_id: str
+    # Preferred caption languages, e.g. "es, en"; the first track otherwise
+    language: Optional[str] = None
+    # A second track to return alongside, lined up segment by segment
+    compare_language: Optional[str] = None
+
+def youtube_response(transcript_data: dict, video_id: str, original_url: str) -> dict:
+    transcript_id = transcript_store.youtube_transcript_id(video_id, transcript_data["languageKey"])
+    transcript_store.put_transcript(transcript_id, transcript_data["segments"])
+    # Return video_id instead of audio_url for YouTube videos
+    # The frontend will use this to embed the YouTube player
+    body = {
+        "transcript": transcript_data["text"], 
+        "segments": transcript_data["segments"],
+        "videoId": video_id,  # NEW: Return video ID instead of audio URL
+        "sourceUrl": original_url,
+        "transcriptId": transcript_id,
+        "language": transcript_data["language"],
+        "availableLanguages": transcript_data["availableLanguages"]
+    }
+    comparison = transcript_data.get("comparison")
+    if comparison:
+        comparison_id = transcript_store.youtube_transcript_id(video_id, comparison["languageKey"])
+        transcript_store.put_transcript(comparison_id, comparison["segments"])
+        body["comparison"] = {**comparison, "transcriptId": comparison_id}
+    return body
+
+async def _with_first_page(body: dict, segment_limit: Optional[int]) -> dict:
+    """
+    With ?segment_limit=N only the first N segments are sent, plus a cursor for
+    /transcripts/{id}/segments/page to fetch the rest lazily.
+    """
+    if segment_limit and body.get("transcriptId"):
+        transcript = await transcript_store.get_transcript(body["transcriptId"])
+        if transcript is not None:
+            body = {**body, **transcript_store.first_page(transcript, segment_limit)}
+    return body
 
 @router.post("/transcribe-youtube/")
-async def transcribe_youtube(request: YouTubeRequest):
+async def transcribe_youtube(request: YouTubeRequest, http_request: Request, segment_limit: Optional[int] = None):
     """
     Fetch transcript for a YouTube video using youtube-transcript.io API
     
     This endpoint no longer downloads audio or uses Whisper.
     Instead, it fetches the transcript directly from YouTube via youtube-transcript.io.
+    
+    All caption tracks are cached together, so requests for another `language`
+    or a `compare_language` side-by-side view don't call the API again.
     """
     try:
         print("Received YouTube transcription request...")
@@ -29,17 +75,13 @@ async def transcribe_youtube(request: YouTubeRequest):
         # NEW: Use youtube_transcript_service instead of downloading audio
         transcript_data, video_id, original_url = await process_youtube_video(
             request.url, 
-            request.client_id
+            request.client_id,
+            request.language,
+            request.compare_language
         )
         
-        # Return video_id instead of audio_url for YouTube videos
-        # The frontend will use this to embed the YouTube player
-        return {
-            "transcript": transcript_data["text"], 
-            "segments": transcript_data["segments"],
-            "videoId": video_id,  # NEW: Return video ID instead of audio URL
-            "sourceUrl": original_url
-        }
+        body = await _with_first_page(youtube_response(transcript_data, video_id, original_url), segment_limit)
+        return await transcript_response(http_request, body)
     except Exception as e:
         error_message = str(e)
         print(f"Exception occurred: {error_message}")
@@ -51,72 +93,284 @@ async def transcribe_youtube(request: YouTubeRequest):
         )
 
 @router.post("/upload/")
-async def upload_file(file: UploadFile = File(...), client_id: str = Form(...)):
+async def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    client_id: str = Form(...),
+    segment_limit: Optional[int] = None,
+    stream_segments: bool = False,
+):
     """
     Upload an audio/video file and get its transcript with timestamps.
     
-    This endpoint is UNCHANGED - still uses Whisper API for transcription.
+    Still uses Whisper API for transcription. For long files prefer
+    /jobs/upload/, which returns straight away and reports progress by job id.
+    
+    With ?stream_segments=true, segments are pushed over the client's JSON
+    websocket as they are transcribed and the response only confirms completion.
     """
     try:
         print("Received file upload request...")
         
-        # Step 1: Save the uploaded file to Supabase
-        filename, file_url = await save_uploaded_file(file)
-        print(f"File uploaded to Supabase: {filename}")
-        
-        # Step 2: Transcribe the audio using Whisper
-        transcript_data = await transcribe_audio(file_url, client_id)
+        file_extension = os.path.splitext(file.filename)[1]
+        spooled_path, content_hash = await spool_upload(file, file_extension)
+        response = await process_upload(
+            spooled_path, content_hash, file_extension, file.content_type, client_id,
+            stream_segments=stream_segments,
+        )
         
         print("File processing complete.")
-        return {
-            "transcript": transcript_data["text"], 
-            "segments": transcript_data["segments"],
-            "audioUrl": file_url  # Still return audio URL for uploaded files
-        }
+        return await transcript_response(request, await _with_first_page(response, segment_limit))
     except Exception as e:
         error_message = f"Error processing uploaded file: {str(e)}"
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=error_message)
     
+# Background jobs: submit returns a job id straight away, the work happens in the
+# job queue's workers, and GET /jobs/{id} (or the websocket) reports progress.
+
+async def run_upload_job(payload: dict, job) -> dict:
+    # Raise transcription errors so the job ends up FAILED, not SUCCEEDED with the error as its text
+    return await process_upload(**payload, client_id=job.client_id, on_stage=job.set_stage, raise_errors=True)
+
+def cleanup_upload_job(payload: dict):
+    if os.path.exists(payload["spooled_path"]):
+        os.remove(payload["spooled_path"])
+
+async def run_youtube_job(payload: dict, job) -> dict:
+    await job.set_stage("fetch")
+    transcript_data, video_id, original_url = await process_youtube_video(
+        payload["url"], job.client_id, payload.get("language"), payload.get("compare_language")
+    )
+    return youtube_response(transcript_data, video_id, original_url)
+
+job_queue.register("upload", run_upload_job, cleanup_upload_job)
+job_queue.register("youtube", run_youtube_job)
+
+def _job_accepted(job_id: str) -> JSONResponse:
+    return JSONResponse(status_code=202, content={"jobId": job_id, "status": "queued"})
+
+@router.post("/jobs/upload/")
+async def submit_upload_job(
+    file: UploadFile = File(...),
+    client_id: str = Form(...),
+    stream_segments: bool = False,
+):
+    """
+    Queue an uploaded file for transcription and return its job id immediately.
+    
+    The file is spooled to local disk before returning, since the upload body is
+    gone once the request ends.
+    """
+    file_extension = os.path.splitext(file.filename)[1]
+    spooled_path, content_hash = await spool_upload(file, file_extension)
+    payload = {
+        "spooled_path": spooled_path,
+        "content_hash": content_hash,
+        "file_extension": file_extension,
+        "content_type": file.content_type,
+        "stream_segments": stream_segments,
+    }
+    try:
+        job_id = await job_queue.submit("upload", payload, client_id)
+    except JobRejected as e:
+        cleanup_upload_job(payload)
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "5"})
+    return _job_accepted(job_id)
+
+@router.post("/jobs/transcribe-youtube/")
+async def submit_youtube_job(request: YouTubeRequest):
+    """Queue a YouTube transcript fetch and return its job id immediately"""
+    try:
+        payload = {"url": request.url, "language": request.language, "compare_language": request.compare_language}
+        job_id = await job_queue.submit("youtube", payload, request.client_id)
+    except JobRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "5"})
+    return _job_accepted(job_id)
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Status, current stage and (once finished) result or error of a job"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await transcript_response(request, job)
+
+# Segment retrieval for the players: they only need what is near the playback
+# position, so long transcripts can be loaded a window or a page at a time.
+
+async def _get_indexed_transcript(transcript_id: str) -> transcript_store.IndexedTranscript:
+    transcript = await transcript_store.get_transcript(transcript_id)
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return transcript
+
+@router.get("/transcripts/{transcript_id}")
+async def get_transcript_info(transcript_id: str):
+    transcript = await _get_indexed_transcript(transcript_id)
+    return {"transcriptId": transcript_id, "segmentCount": len(transcript), "duration": transcript.duration}
+
+@router.get("/transcripts/{transcript_id}/segments")
+async def get_segment_window(transcript_id: str, request: Request, start: float = 0, end: Optional[float] = None):
+    """Segments overlapping the time window [start, end) in seconds"""
+    transcript = await _get_indexed_transcript(transcript_id)
+    first_index, segments = transcript.window(start, end if end is not None else float("inf"))
+    return await transcript_response(request, {
+        "transcriptId": transcript_id,
+        "firstIndex": first_index,
+        "segments": segments,
+    })
+
+@router.get("/transcripts/{transcript_id}/segments/at")
+async def get_segment_at(transcript_id: str, t: float):
+    """The segment playing at time t (seconds), or null if t falls between segments"""
+    transcript = await _get_indexed_transcript(transcript_id)
+    index = transcript.at(t)
+    return {
+        "transcriptId": transcript_id,
+        "index": index,
+        "segment": transcript.segments[index] if index is not None else None,
+    }
+
+@router.get("/transcripts/{transcript_id}/segments/page")
+async def get_segment_page(transcript_id: str, request: Request, cursor: Optional[str] = None, limit: int = transcript_store.SEGMENT_PAGE_SIZE):
+    """Segments in order, `limit` at a time; pass back nextCursor until it is null"""
+    transcript = await _get_indexed_transcript(transcript_id)
+    try:
+        offset = transcript_store.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    segments, next_offset = transcript.page(offset, max(1, min(limit, transcript_store.SEGMENT_PAGE_MAX)))
+    return await transcript_response(request, {
+        "transcriptId": transcript_id,
+        "segments": segments,
+        "nextCursor": transcript_store.encode_cursor(next_offset),
+    })
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and size of the transcript caches"""
+    return {
+        "uploads": transcript_cache.stats(),
+        "youtube": {
+            **youtube_transcript_service.transcript_cache.stats(),
+            **youtube_transcript_service.transcript_requests.stats(),
+            **youtube_transcript_service.transcript_batcher.stats(),
+        },
+    }
+
 class ChatRequest(BaseModel):
     transcript: str
     user_message: str
     selected_text: str = ""
-
-client = OpenAI()
+    # Optional timed segments of the transcript; used to pick relevant context
+    segments: Optional[List[dict]] = None
 
 @router.post("/chat")
 async def chat_with_transcript(request: ChatRequest):
     """
     Chat with GPT-4o-mini using the transcript and user message.
-    
-    This endpoint is UNCHANGED.
     """
     print("request: ", request)
     try:
-        # Call OpenAI API
-        # Prepare system message with transcript and highlight selected text if available
-        system_message = f"You are a language learning teacher helping the user to improve their target language by talking to them about this text: {request.transcript} which is in their target language. The text is a transcript of some audio or video content that they are using to study. Your only role is to help the user to improve in their target language, you cannot help with anything that is unrelated to this role."
-        
-        # Add context about the selected text if it exists
-        messages = [{"role": "system", "content": system_message}]
-        
-        if request.selected_text:
-            messages.append({"role": "system", "content": f"The user has selected/highlighted this specific part of the text: \"{request.selected_text}\". They may be asking about this particular section."})
-        
-        messages.append({"role": "user", "content": request.user_message})
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
+        messages = build_chat_messages(
+            request.transcript, request.user_message, request.selected_text, request.segments
         )
-        print("OpenAI Response:", response)
-        # Extract the chatbot's response
-        assistant_message = response.choices[0].message.content
+        assistant_message = await complete_chat(messages)
+        return {"response": assistant_message}
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Chatbot error: {str(e)}")
+
+@router.post("/chat/stream")
+async def stream_chat_with_transcript(request: ChatRequest):
+    """
+    Same as /chat, but the reply is streamed token by token as server-sent events
+    so the UI can show the first words without waiting for the whole answer.
+    """
+    messages = build_chat_messages(
+        request.transcript, request.user_message, request.selected_text, request.segments
+    )
+    return StreamingResponse(
+        stream_chat(messages),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class ChatSessionRequest(BaseModel):
+    # Either the transcript itself or the id of a transcript saved in Supabase
+    # (the latter needs the owner's access token as "Authorization: Bearer ...")
+    transcript: Optional[str] = None
+    transcript_id: Optional[str] = None
+    segments: Optional[List[dict]] = None
+
+class ChatSessionMessage(BaseModel):
+    user_message: str
+    selected_text: str = ""
+
+def _get_chat_session(session_id: str) -> chat_sessions.ChatSession:
+    session = chat_sessions.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+    return session
+
+@router.post("/chat/sessions")
+async def create_chat_session(request: ChatSessionRequest, authorization: Optional[str] = Header(None)):
+    """
+    Start a conversation about a transcript. The transcript is sent (or looked up)
+    once; later messages only need the returned session id.
+    
+    Saved transcripts are only looked up for their owner, identified by the
+    Supabase access token in the Authorization header.
+    """
+    transcript = request.transcript
+    if transcript is None and request.transcript_id:
+        access_token = None
+        if authorization and authorization.lower().startswith("bearer "):
+            access_token = authorization[len("bearer "):].strip()
+        try:
+            transcript = await chat_sessions.load_stored_transcript(request.transcript_id, access_token)
+        except chat_sessions.NotAuthenticated as e:
+            raise HTTPException(status_code=401, detail=str(e))
+        if transcript is None:
+            raise HTTPException(status_code=404, detail="Transcript not found")
+    if not transcript:
+        raise HTTPException(status_code=400, detail="Provide either transcript or transcript_id")
+    
+    session = chat_sessions.create_session(transcript, request.segments)
+    return {"sessionId": session.session_id}
+
+@router.post("/chat/sessions/{session_id}/messages")
+async def send_chat_session_message(session_id: str, request: ChatSessionMessage):
+    """Ask a question in an existing chat session; earlier turns are kept server-side"""
+    session = _get_chat_session(session_id)
+    try:
+        messages = session.build_messages(request.user_message, request.selected_text)
+        assistant_message = await complete_chat(messages)
+        session.record_turn(request.user_message, assistant_message)
         return {"response": assistant_message}
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chatbot error: {str(e)}")
+
+@router.post("/chat/sessions/{session_id}/messages/stream")
+async def stream_chat_session_message(session_id: str, request: ChatSessionMessage):
+    """Streaming variant of the session message endpoint (server-sent events)"""
+    session = _get_chat_session(session_id)
+    messages = session.build_messages(request.user_message, request.selected_text)
+    return StreamingResponse(
+        stream_chat(
+            messages,
+            on_complete=lambda reply: session.record_turn(request.user_message, reply),
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    chat_sessions.delete_session(session_id)
+    return {"status": "deleted"}
     
 
 
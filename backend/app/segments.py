@@ -0,0 +1,78 @@
+# segments.py
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Union
+
+
+class SegmentStore:
+    """
+    Compact, read-only list of timed transcript segments.
+
+    A list of {"text", "start", "end"} dicts costs a dict, two floats and a string
+    object per segment. Here all segment texts share one string, sliced by an
+    offsets array, and the times are packed into two float arrays, which takes a
+    fraction of the memory for long transcripts. Indexing and iterating still
+    yield the usual dicts, so code that reads segments doesn't need to change.
+    """
+
+    __slots__ = ("_text", "_offsets", "starts", "ends")
+
+    def __init__(self, text: str, offsets: array, starts: array, ends: array):
+        self._text = text
+        # Segment i is _text[_offsets[i]:_offsets[i + 1]]
+        self._offsets = offsets
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_segments(cls, segments: Union["SegmentStore", Iterable[Dict]]) -> "SegmentStore":
+        if isinstance(segments, SegmentStore):
+            return segments
+        texts = []
+        offsets = array("I", [0])
+        starts = array("d")
+        ends = array("d")
+        position = 0
+        for segment in segments:
+            text = segment["text"]
+            texts.append(text)
+            position += len(text)
+            offsets.append(position)
+            starts.append(float(segment["start"]))
+            ends.append(float(segment["end"]))
+        return cls("".join(texts), offsets, starts, ends)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __bool__(self) -> bool:
+        return len(self.starts) > 0
+
+    def text_at(self, index: int) -> str:
+        return self._text[self._offsets[index]:self._offsets[index + 1]]
+
+    def __getitem__(self, index: int) -> Dict:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return {"text": self.text_at(index), "start": self.starts[index], "end": self.ends[index]}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield {"text": self.text_at(index), "start": self.starts[index], "end": self.ends[index]}
+
+    def to_list(self) -> List[Dict]:
+        return list(self)
+
+    def full_text(self) -> str:
+        """The whole transcript, rebuilt from the segments rather than stored twice"""
+        return " ".join(self.text_at(index).strip() for index in range(len(self)))
+
+    def nbytes(self) -> int:
+        return (
+            len(self._text.encode("utf-8"))
+            + self._offsets.itemsize * len(self._offsets)
+            + self.starts.itemsize * len(self.starts)
+            + self.ends.itemsize * len(self.ends)
+        )
@@ -0,0 +1,251 @@
+# stt.py
+
+import os
+import asyncio
+import importlib.util
+from abc import ABC, abstractmethod
+import aiofiles
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from .openai_client import get_openai_client, openai_slot, openai_upstream
+from .audio_chunking import WHISPER_MAX_WORKERS, SegmentCallback, probe_duration, transcribe_in_chunks
+from .metrics import Counter, register_metric, timed
+
+# Which speech-to-text backend transcribes uploads:
+#   "openai" - the Whisper API (default)
+#   "local"  - faster-whisper on this machine's CPU, no network needed
+#   "auto"   - local for clips up to LOCAL_STT_MAX_SECONDS while the local pool
+#              has room, the API for everything else
+STT_BACKEND = os.getenv("STT_BACKEND", "openai").lower()
+
+WHISPER_MODEL = "whisper-1"
+
+# faster-whisper model ("tiny", "base", "small", ... or a path to a converted
+# model) and CTranslate2 compute type; int8 is the fast option on CPU
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "small")
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_BEAM_SIZE = int(os.getenv("LOCAL_STT_BEAM_SIZE", 1))
+# Worker processes, each holding its own copy of the model, and the threads each one uses
+LOCAL_STT_WORKERS = int(os.getenv("LOCAL_STT_WORKERS", 1))
+LOCAL_STT_CPU_THREADS = int(os.getenv("LOCAL_STT_CPU_THREADS", max((os.cpu_count() or 2) // max(LOCAL_STT_WORKERS, 1), 1)))
+
+# Routing for STT_BACKEND=auto: longer files go to the API, and so does anything
+# arriving while LOCAL_STT_MAX_PENDING files are already queued or running locally
+LOCAL_STT_MAX_SECONDS = float(os.getenv("LOCAL_STT_MAX_SECONDS", 120))
+LOCAL_STT_MAX_PENDING = int(os.getenv("LOCAL_STT_MAX_PENDING", LOCAL_STT_WORKERS * 2))
+
+stt_files = register_metric(Counter("lingoscribe_stt_files_total", "Transcribed files by backend"))
+
+# Set in each local worker process by _load_model
+_model = None
+
+
+def _load_model():
+    """Process pool initializer: load the model once per worker, not per file"""
+    global _model
+    from faster_whisper import WhisperModel
+    _model = WhisperModel(
+        LOCAL_STT_MODEL,
+        device="cpu",
+        compute_type=LOCAL_STT_COMPUTE_TYPE,
+        cpu_threads=LOCAL_STT_CPU_THREADS,
+    )
+
+
+def _transcribe_locally(path: str) -> Dict:
+    """Runs inside the local pool; same shape as the Whisper API result"""
+    segments = []
+    # transcribe() is lazy; decoding happens as the generator is consumed
+    for segment in _model.transcribe(path, beam_size=LOCAL_STT_BEAM_SIZE)[0]:
+        segments.append({
+            "text": segment.text,
+            "start": segment.start,
+            "end": segment.end
+        })
+    return {
+        "text": "".join(segment["text"] for segment in segments).strip(),
+        "segments": segments
+    }
+
+
+class TranscriptionBackend(ABC):
+    """
+    A speech-to-text engine. `transcribe_file` takes a local audio file and
+    returns {"text": str, "segments": [{"text", "start", "end"}, ...]}; long
+    files are split by transcribe_in_chunks, which runs up to `max_workers`
+    chunks at once.
+    """
+
+    name = ""
+    max_workers = 1
+
+    @abstractmethod
+    async def transcribe_file(self, path: str) -> Dict:
+        ...
+
+
+class OpenAIBackend(TranscriptionBackend):
+    """OpenAI's hosted whisper-1"""
+
+    name = "openai"
+    max_workers = WHISPER_MAX_WORKERS
+
+    async def transcribe_file(self, path: str) -> Dict:
+        """
+        Send a local audio file to Whisper and return its text and timed segments.
+
+        Requests share the async OpenAI client and wait for a free whisper-1 slot,
+        so many chunks can be in flight without using a thread each.
+        """
+        print(f"Opening file for transcription: {path}")
+        async with aiofiles.open(path, "rb") as audio_file:
+            audio_bytes = await audio_file.read()
+
+        async with openai_slot(WHISPER_MODEL):
+            with timed("whisper_request"):
+                response = await openai_upstream.call(lambda: get_openai_client().audio.transcriptions.create(
+                    file=(os.path.basename(path), audio_bytes),
+                    model=WHISPER_MODEL,
+                    response_format="verbose_json"
+                ))
+
+        # Process segments with timing information
+        segments = []
+        for segment in response.segments:
+            segments.append({
+                "text": segment.text,
+                "start": segment.start,
+                "end": segment.end
+            })
+
+        return {
+            "text": response.text,
+            "segments": segments
+        }
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    faster-whisper (CTranslate2) on the CPU.
+
+    Runs in its own process pool so decoding never holds the event loop or the
+    GIL. Each worker loads the model once when it starts; `warm` starts them
+    ahead of the first request.
+    """
+
+    name = "local"
+    max_workers = LOCAL_STT_WORKERS
+
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Files routed here that haven't finished yet
+        self.pending = 0
+
+    @staticmethod
+    def installed() -> bool:
+        # find_spec doesn't import it; the model libraries only load in the workers
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=max(LOCAL_STT_WORKERS, 1), initializer=_load_model)
+        return self._pool
+
+    def warm(self):
+        # Blocks until every worker has started and loaded the model
+        pool = self.get_pool()
+        try:
+            for future in [pool.submit(os.getpid) for _ in range(max(LOCAL_STT_WORKERS, 1))]:
+                future.result()
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        # A worker died (e.g. OOM-killed loading the model); the pool can't be
+        # used again, so the next call starts a fresh one
+        pool.shutdown(wait=False, cancel_futures=True)
+        if self._pool is pool:
+            self._pool = None
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def transcribe_file(self, path: str) -> Dict:
+        loop = asyncio.get_running_loop()
+        pool = self.get_pool()
+        with timed("local_stt"):
+            try:
+                return await loop.run_in_executor(pool, _transcribe_locally, path)
+            except BrokenProcessPool:
+                self._discard(pool)
+                raise
+
+
+openai_backend = OpenAIBackend()
+local_backend = LocalWhisperBackend()
+
+
+def local_stt_enabled() -> bool:
+    return STT_BACKEND in ("local", "auto")
+
+
+def choose_backend(duration: float) -> TranscriptionBackend:
+    """Pick the backend for a file of `duration` seconds according to STT_BACKEND"""
+    if STT_BACKEND == "local":
+        return local_backend
+    if STT_BACKEND != "auto" or not LocalWhisperBackend.installed():
+        return openai_backend
+    if duration > LOCAL_STT_MAX_SECONDS or local_backend.pending >= LOCAL_STT_MAX_PENDING:
+        return openai_backend
+    return local_backend
+
+
+async def transcribe(path: str, on_segments: Optional[SegmentCallback] = None) -> Dict:
+    """
+    Transcribe a local audio file with the backend chosen for it.
+
+    In auto mode a file the local engine fails on is retried with the API,
+    unless some of its segments were already streamed to the client.
+    """
+    loop = asyncio.get_running_loop()
+    with timed("probe"):
+        duration = await loop.run_in_executor(None, probe_duration, path)
+    backend = choose_backend(duration)
+    stt_files.inc(backend=backend.name)
+    print(f"Transcribing {duration:.0f}s of audio with the {backend.name} backend")
+
+    streamed = False
+
+    async def forward(first_index, segments):
+        nonlocal streamed
+        streamed = True
+        await on_segments(first_index, segments)
+
+    if backend is not local_backend:
+        return await transcribe_in_chunks(path, backend.transcribe_file, backend.max_workers, on_segments, duration)
+
+    local_backend.pending += 1
+    try:
+        return await transcribe_in_chunks(
+            path, backend.transcribe_file, backend.max_workers, forward if on_segments else None, duration
+        )
+    except Exception as e:
+        if STT_BACKEND != "auto" or streamed:
+            raise
+        print(f"Local transcription failed ({e}); falling back to the API")
+    finally:
+        local_backend.pending -= 1
+
+    stt_files.inc(backend=openai_backend.name)
+    return await transcribe_in_chunks(path, openai_backend.transcribe_file, openai_backend.max_workers, on_segments, duration)
+
+
+def stats() -> Dict:
+    return {
+        "localPending": local_backend.pending,
+        "localMaxPending": LOCAL_STT_MAX_PENDING,
+    }
@@ -1,21 +1,27 @@
-from supabase import create_client
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 # Get Supabase credentials from environment variables
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-# Debug prints
-print(f"DEBUG - URL: {SUPABASE_URL}")
-print(f"DEBUG - Key length: {len(SUPABASE_SERVICE_KEY) if SUPABASE_SERVICE_KEY else 0}")
-print(f"DEBUG - Key starts with: {SUPABASE_SERVICE_KEY[:20] if SUPABASE_SERVICE_KEY else None}")
-print(f"DEBUG - Key repr: {repr(SUPABASE_SERVICE_KEY[:30]) if SUPABASE_SERVICE_KEY else None}")
+_client = None
+
+
+def require_supabase_config():
+    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+        raise ValueError("Missing Supabase environment variables")
+
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-    raise ValueError("Missing Supabase environment variables")
+def get_supabase():
+    """
+    Return the Supabase client, creating it on first use.
 
-# Create Supabase client
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
\ No newline at end of file
+    Importing this module has no side effects, so the app starts (and worker
+    processes fork) without the supabase package being loaded or configured.
+    """
+    global _client
+    if _client is None:
+        require_supabase_config()
+        from supabase import create_client
+        _client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _client
@@ -0,0 +1,144 @@
+# transcoding.py
+
+import os
+import asyncio
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+import ffmpeg
+from .metrics import timed
+
+# Output format for everything we send to Whisper and storage: mono 16 kHz at a
+# speech-friendly bitrate. "mp3" plays everywhere; "opus" is smaller again.
+TRANSCODE_CODEC = os.getenv("TRANSCODE_CODEC", "mp3").lower()
+TRANSCODE_BITRATE = os.getenv("TRANSCODE_BITRATE", "32k")
+TRANSCODE_SAMPLE_RATE = 16000
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", os.cpu_count() or 2))
+
+# codec name -> (ffmpeg encoder, file extension, content type)
+CODECS = {
+    "mp3": ("libmp3lame", ".mp3", "audio/mpeg"),
+    "opus": ("libopus", ".ogg", "audio/ogg"),
+}
+
+_process_pool = None
+
+
+def _output_format() -> Tuple[str, str, str]:
+    return CODECS.get(TRANSCODE_CODEC, CODECS["mp3"])
+
+
+def _bitrate_to_bps(bitrate: str) -> int:
+    bitrate = bitrate.lower()
+    if bitrate.endswith("k"):
+        return int(float(bitrate[:-1]) * 1000)
+    return int(bitrate)
+
+
+def needs_transcode(path: str) -> bool:
+    """
+    Whether a file should be re-encoded before upload.
+
+    Files that already are compact mono speech audio are left alone; anything with
+    a video track, several channels, a high sample rate or a high bitrate is not.
+    """
+    info = ffmpeg.probe(path)
+    streams = info.get("streams", [])
+
+    for stream in streams:
+        # Cover art in mp3/m4a files shows up as a video stream too
+        if stream.get("codec_type") == "video" and not stream.get("disposition", {}).get("attached_pic"):
+            return True
+
+    audio_streams = [stream for stream in streams if stream.get("codec_type") == "audio"]
+    if not audio_streams:
+        raise Exception("No audio track found in the uploaded file")
+
+    audio = audio_streams[0]
+    if audio.get("codec_name") not in ("mp3", "opus"):
+        return True
+    if int(audio.get("channels", 1)) > 1:
+        return True
+    if int(audio.get("sample_rate", 0)) > TRANSCODE_SAMPLE_RATE:
+        return True
+
+    bit_rate = audio.get("bit_rate") or info.get("format", {}).get("bit_rate")
+    if bit_rate and int(bit_rate) > _bitrate_to_bps(TRANSCODE_BITRATE) * 1.5:
+        return True
+    return False
+
+
+def transcode_audio(source_path: str, output_path: str):
+    """Extract the first audio track and encode it as low-bitrate mono 16 kHz"""
+    encoder, _, _ = _output_format()
+    (
+        ffmpeg
+        .input(source_path)
+        .output(
+            output_path,
+            map="0:a:0",
+            vn=None,
+            sn=None,
+            ac=1,
+            ar=TRANSCODE_SAMPLE_RATE,
+            acodec=encoder,
+            audio_bitrate=TRANSCODE_BITRATE,
+        )
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+
+def _transcode_if_needed(source_path: str, output_path: str) -> bool:
+    """Runs inside the process pool; returns True if a transcoded copy was written"""
+    if not needs_transcode(source_path):
+        return False
+    transcode_audio(source_path, output_path)
+    return True
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=max(TRANSCODE_WORKERS, 1))
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+async def prepare_audio(source_path: str) -> Tuple[str, str]:
+    """
+    Make sure a local media file is compact audio before it is stored or transcribed.
+
+    Returns (path, content_type). If the file had to be transcoded, the path is a
+    new temp file the caller is responsible for removing; otherwise it is
+    `source_path` unchanged and the content type is None.
+    """
+    _, extension, content_type = _output_format()
+    temp_fd, output_path = tempfile.mkstemp(suffix=extension)
+    os.close(temp_fd)
+
+    loop = asyncio.get_running_loop()
+    try:
+        with timed("transcode"):
+            transcoded = await loop.run_in_executor(
+                get_process_pool(), _transcode_if_needed, source_path, output_path
+            )
+    except Exception:
+        os.remove(output_path)
+        raise
+
+    if not transcoded:
+        os.remove(output_path)
+        return source_path, None
+
+    print(
+        f"Transcoded {os.path.getsize(source_path)} bytes to "
+        f"{os.path.getsize(output_path)} bytes of {TRANSCODE_CODEC}"
+    )
+    return output_path, content_type
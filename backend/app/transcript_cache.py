@@ -0,0 +1,145 @@
+# transcript_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Optional
+from .encoding import dumps
+from .segments import SegmentStore
+
+# SQLite file holding transcripts keyed by the SHA-256 of the uploaded bytes
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", "storage/cache/transcripts.sqlite3")
+
+# Least recently used entries are evicted once the stored transcripts exceed this size
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+class TranscriptCache:
+    """
+    Persistent, size-bounded transcript cache keyed by content hash.
+
+    The same lesson audio uploaded twice hashes to the same key, so the second
+    upload can skip storage and Whisper entirely.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Totals as of this worker's last write, so stats() never touches SQLite
+        self.entries = 0
+        self.size = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    content_hash TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    segments TEXT NOT NULL,
+                    audio_url TEXT,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used)"
+            )
+            self._connection = connection
+            self._count(connection)
+        return self._connection
+
+    def _count(self, connection: sqlite3.Connection):
+        self.entries, self.size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts"
+        ).fetchone()
+
+    def warm(self):
+        """Open the database (blocking); called from the app's warm-up"""
+        with self._lock:
+            self._connect()
+
+    def _get(self, content_hash: str) -> Optional[Dict]:
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT text, segments, audio_url FROM transcripts WHERE content_hash = ?",
+                (content_hash,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute(
+                "UPDATE transcripts SET last_used = ? WHERE content_hash = ?",
+                (time.time(), content_hash),
+            )
+            connection.commit()
+            self.hits += 1
+
+        text, segments, audio_url = row
+        return {
+            "text": text,
+            "segments": SegmentStore.from_segments(json.loads(segments)),
+            "audio_url": audio_url,
+        }
+
+    def _put(self, content_hash: str, transcript_data: Dict, audio_url: str):
+        segments = dumps(transcript_data["segments"]).decode("utf-8")
+        size = len(transcript_data["text"]) + len(segments)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, transcript_data["text"], segments, audio_url, size, time.time()),
+            )
+            self._evict(connection)
+            connection.commit()
+            self._count(connection)
+
+    def _evict(self, connection: sqlite3.Connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        while total > self.max_bytes:
+            row = connection.execute(
+                "SELECT content_hash, size FROM transcripts ORDER BY last_used LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            connection.execute("DELETE FROM transcripts WHERE content_hash = ?", (row[0],))
+            total -= row[1]
+            self.evictions += 1
+
+    async def get(self, content_hash: str) -> Optional[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._get, content_hash)
+
+    async def put(self, content_hash: str, transcript_data: Dict, audio_url: str):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._put, content_hash, transcript_data, audio_url)
+
+    def stats(self) -> Dict:
+        # Read by /metrics on the event loop, so only in-memory counters
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self.entries,
+            "bytes": self.size,
+            "maxBytes": self.max_bytes,
+        }
+
+
+transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_PATH, TRANSCRIPT_CACHE_MAX_BYTES)
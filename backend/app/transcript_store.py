@@ -0,0 +1,144 @@
+# transcript_store.py
+
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+from .cache import TTLCache
+from .segments import SegmentStore
+from .transcript_cache import transcript_cache
+from .youtube_transcript_service import transcript_cache as youtube_cache
+
+# Transcripts kept in memory for the segment endpoints; evicted ones are
+# reloaded from the upload cache or the YouTube cache on demand
+TRANSCRIPT_STORE_TTL_SECONDS = float(os.getenv("TRANSCRIPT_STORE_TTL_SECONDS", 6 * 60 * 60))
+TRANSCRIPT_STORE_MAX = int(os.getenv("TRANSCRIPT_STORE_MAX", 500))
+
+SEGMENT_PAGE_SIZE = int(os.getenv("SEGMENT_PAGE_SIZE", 200))
+SEGMENT_PAGE_MAX = int(os.getenv("SEGMENT_PAGE_MAX", 2000))
+
+YOUTUBE_PREFIX = "yt-"
+
+
+def upload_transcript_id(content_hash: str) -> str:
+    return content_hash
+
+
+def youtube_transcript_id(video_id: str, track_key: Optional[str] = None) -> str:
+    # Each caption track is its own transcript, keyed by CaptionTracks.key
+    # (the language code where there is one); video ids never contain ":"
+    if track_key:
+        return f"{YOUTUBE_PREFIX}{video_id}:{track_key}"
+    return f"{YOUTUBE_PREFIX}{video_id}"
+
+
+class IndexedTranscript:
+    """
+    Segments sorted by start time, with the lookups the player needs.
+
+    `starts` is sorted, so the segment playing at time t is a binary search away.
+    Segments can overlap, so window queries also keep `reach`, the running
+    maximum of segment end times: the first segment that can still be playing
+    at time t is the first one whose reach passes t.
+    """
+
+    def __init__(self, segments: SegmentStore):
+        if any(later < earlier for earlier, later in zip(segments.starts, segments.starts[1:])):
+            ordered = sorted(segments, key=lambda segment: segment["start"])
+            segments = SegmentStore.from_segments(ordered)
+        self.segments = segments
+        self.reach = array("d", accumulate(segments.ends, max))
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    @property
+    def duration(self) -> float:
+        return self.reach[-1] if len(self.reach) else 0.0
+
+    def _slice(self, first: int, last: int) -> List[Dict]:
+        return [self.segments[index] for index in range(first, last)]
+
+    def window(self, start: float, end: float) -> Tuple[int, List[Dict]]:
+        """
+        The run of segments covering [start, end), and the index of the first one.
+        Where segments overlap, a short one inside the run may end before `start`.
+        """
+        first = bisect_right(self.reach, start)
+        last = bisect_left(self.segments.starts, end)
+        return first, self._slice(first, max(first, last))
+
+    def at(self, time: float) -> Optional[int]:
+        """Index of the segment playing at `time`, or None if it falls in a gap"""
+        index = bisect_right(self.segments.starts, time) - 1
+        # With overlaps the latest-starting segment may already have ended while
+        # an earlier, longer one is still playing
+        while index >= 0 and self.reach[index] > time:
+            if self.segments.ends[index] > time:
+                return index
+            index -= 1
+        return None
+
+    def page(self, offset: int, limit: int) -> Tuple[List[Dict], Optional[int]]:
+        """`limit` segments from `offset`, and the offset of the next page (None at the end)"""
+        last = min(offset + limit, len(self))
+        return self._slice(offset, last), (last if last < len(self) else None)
+
+
+_transcripts = TTLCache(TRANSCRIPT_STORE_MAX, TRANSCRIPT_STORE_TTL_SECONDS)
+
+
+def put_transcript(transcript_id: str, segments) -> IndexedTranscript:
+    transcript = _transcripts.get(transcript_id)
+    if transcript is None or transcript.segments is not segments:
+        transcript = IndexedTranscript(SegmentStore.from_segments(segments))
+        _transcripts.set(transcript_id, transcript)
+    return transcript
+
+
+async def get_transcript(transcript_id: str) -> Optional[IndexedTranscript]:
+    """
+    Look up a transcript by id. If this worker doesn't have it (evicted, or it was
+    produced by another worker) it is rebuilt from the shared caches.
+
+    This backs unauthenticated read routes, so it never fetches from upstream:
+    a YouTube transcript nobody has requested through /youtube is not found.
+    """
+    transcript = _transcripts.get(transcript_id)
+    if transcript is not None:
+        return transcript
+
+    if transcript_id.startswith(YOUTUBE_PREFIX):
+        video_id, _, track_key = transcript_id[len(YOUTUBE_PREFIX):].partition(":")
+        tracks = youtube_cache.get(video_id)
+        if tracks is None:
+            return None
+        # Exact match only: the first track stands in for no key, never for a wrong one
+        index = tracks.lookup(track_key) if track_key else 0
+        if index is None:
+            return None
+        return put_transcript(transcript_id, tracks.tracks[index])
+
+    cached = await transcript_cache.get(transcript_id)
+    if cached is None:
+        return None
+    return put_transcript(transcript_id, cached["segments"])
+
+
+def encode_cursor(offset: Optional[int]) -> Optional[str]:
+    return None if offset is None else str(offset)
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    if not cursor.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(cursor)
+
+
+def first_page(transcript: IndexedTranscript, limit: int) -> Dict:
+    """The `segments` and `nextCursor` fields for a response that sends only the first page"""
+    segments, next_offset = transcript.page(0, max(1, min(limit, SEGMENT_PAGE_MAX)))
+    return {"segments": segments, "nextCursor": encode_cursor(next_offset)}
@@ -2,12 +2,196 @@
 
 import os
 import uuid
+import hashlib
+import asyncio
+import tempfile
 from fastapi import UploadFile
 import aiofiles
-from .supabase_client import supabase
+import httpx
+from .supabase_client import SUPABASE_URL, SUPABASE_SERVICE_KEY, require_supabase_config
+from .transcoding import prepare_audio
+from .http_client import get_http_client
+from .metrics import timed
 
 BUCKET_NAME = "audio"
 
+# Uploads are streamed to storage in chunks of this size, so memory per request
+# stays bounded no matter how large the file is.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# Upper bound on upload bytes held in memory by this process at any one time,
+# shared across all concurrent uploads.
+UPLOAD_MAX_INFLIGHT_BYTES = int(os.getenv("UPLOAD_MAX_INFLIGHT_BYTES", 64 * 1024 * 1024))
+
+
+class ByteBudget:
+    """
+    Process-wide budget of in-flight bytes.
+
+    Callers acquire the size of a chunk before reading it and release it once the
+    chunk has been handed off, so concurrent uploads wait rather than pile up in RAM.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(limit, 1)
+        self.in_use = 0
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self, size: int) -> int:
+        size = min(size, self.limit)
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_use + size <= self.limit)
+            self.in_use += size
+        return size
+
+    async def release(self, size: int):
+        condition = self._get_condition()
+        async with condition:
+            self.in_use -= size
+            condition.notify_all()
+
+
+upload_budget = ByteBudget(UPLOAD_MAX_INFLIGHT_BYTES)
+
+
+async def iter_upload_chunks(file, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Yield an UploadFile (or any file object with an async read) in bounded chunks, charging each chunk against the
+    process-wide upload budget until the consumer asks for the next one.
+    """
+    while True:
+        reserved = await upload_budget.acquire(chunk_size)
+        try:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        finally:
+            await upload_budget.release(reserved)
+
+
+def storage_object_url(filename: str) -> str:
+    """Storage API endpoint for an object in the audio bucket"""
+    require_supabase_config()
+    return f"{SUPABASE_URL}/storage/v1/object/{BUCKET_NAME}/{filename}"
+
+
+def storage_headers(content_type: str = None) -> dict:
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+        "apikey": SUPABASE_SERVICE_KEY,
+    }
+    if content_type:
+        headers["Content-Type"] = content_type
+    return headers
+
+async def spool_upload(file: UploadFile, suffix: str = "") -> tuple:
+    """
+    Copy an upload to a local temp file in bounded chunks.
+
+    The SHA-256 of the content is computed on the way through so it can be used
+    as a cache key without a second pass over the file.
+
+    Returns:
+        Tuple containing (temp file path, hex digest). The caller is responsible
+        for removing the file.
+    """
+    temp_fd, temp_path = tempfile.mkstemp(suffix=suffix)
+    os.close(temp_fd)
+    digest = hashlib.sha256()
+    try:
+        with timed("spool_upload"):
+            await file.seek(0)
+            async with aiofiles.open(temp_path, "wb") as out:
+                async for chunk in iter_upload_chunks(file):
+                    digest.update(chunk)
+                    await out.write(chunk)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest()
+
+
+async def upload_to_storage(path: str, filename: str, content_type: str):
+    """Stream a local file into the audio bucket without loading it into memory"""
+    headers = storage_headers(content_type)
+    headers["x-upsert"] = "false"
+    # Lets storage accept the body without chunked transfer encoding
+    headers["Content-Length"] = str(os.path.getsize(path))
+
+    with timed("storage_upload"):
+        async with aiofiles.open(path, "rb") as source:
+            response = await get_http_client().post(
+                storage_object_url(filename),
+                content=iter_upload_chunks(source),
+                headers=headers,
+                # Large bodies can take a while to write; don't time out mid-upload
+                timeout=httpx.Timeout(30.0, write=None),
+            )
+
+    if response.status_code not in (200, 201):
+        raise Exception(f"Storage upload failed with status {response.status_code}: {response.text}")
+
+
+def guess_content_type(file_extension: str) -> str:
+    # Map extensions to MIME types
+    content_types = {
+        '.mp3': 'audio/mpeg',
+        '.m4a': 'audio/mp4', 
+        '.wav': 'audio/wav',
+        '.ogg': 'audio/ogg',
+        '.flac': 'audio/flac',
+        '.mp4': 'video/mp4',
+        '.mov': 'video/quicktime',
+    }
+    return content_types.get(file_extension.lower(), 'application/octet-stream')
+
+
+async def store_audio_file(spooled_path: str, file_extension: str, content_type: str = None) -> tuple:
+    """
+    Transcode a spooled upload if needed and stream it to Supabase storage.
+
+    Video and high-bitrate audio are transcoded to compact mono audio first, so
+    what gets stored (and later transcribed) is only the audio track. The spooled
+    file itself is left for the caller to remove.
+
+    Returns:
+        Tuple containing (file path in bucket, public URL)
+    """
+    content_type = content_type or guess_content_type(file_extension)
+    
+    audio_path, transcoded_type = await prepare_audio(spooled_path)
+    try:
+        if transcoded_type:
+            content_type = transcoded_type
+            file_extension = os.path.splitext(audio_path)[1]
+        
+        # Generate a unique filename to avoid collisions
+        unique_filename = f"{uuid.uuid4()}{file_extension}"
+        
+        print(f"Uploading file with content type: {content_type}")
+        await upload_to_storage(audio_path, unique_filename, content_type)
+    finally:
+        if audio_path != spooled_path and os.path.exists(audio_path):
+            os.remove(audio_path)
+    
+    return unique_filename, public_url(unique_filename)
+
+
+def public_url(filename: str) -> str:
+    """Public URL of an object in the audio bucket"""
+    # file_url = supabase.storage.from_(BUCKET_NAME).get_public_url(filename)
+    require_supabase_config()
+    return f"{SUPABASE_URL}/storage/v1/object/public/{BUCKET_NAME}/{filename}"
+
+
 async def save_uploaded_file(file: UploadFile, upload_folder: str = None) -> tuple:
     """
     Upload a file to Supabase storage and return the file path and public URL.
@@ -19,40 +203,11 @@ async def save_uploaded_file(file: UploadFile, upload_folder: str = None) -> tup
     Returns:
         Tuple containing (file path in bucket, public URL)
     """
-    # Generate a unique filename to avoid collisions
     file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    
-    # Get content type from file or infer from extension
-    content_type = file.content_type
-    if not content_type:
-        # Map extensions to MIME types
-        content_types = {
-            '.mp3': 'audio/mpeg',
-            '.m4a': 'audio/mp4', 
-            '.wav': 'audio/wav',
-            '.ogg': 'audio/ogg',
-            '.flac': 'audio/flac',
-        }
-        content_type = content_types.get(file_extension.lower(), 'application/octet-stream')
-    
-    print(f"Uploading file with content type: {content_type}")
-    
-    # Read file content
-    content = await file.read()
-    
-    # Upload to Supabase
-    supabase.storage.from_(BUCKET_NAME).upload(
-        unique_filename, 
-        content,
-        {"content-type": content_type}
-    )
-    
-    # Get the public URL
-    # file_url = supabase.storage.from_(BUCKET_NAME).get_public_url(unique_filename)
-
-    supabase_url = os.getenv("SUPABASE_URL")
-    file_url = f"{supabase_url}/storage/v1/object/public/{BUCKET_NAME}/{unique_filename}"
-    
-    return unique_filename, file_url
-
+    spooled_path, _ = await spool_upload(file, file_extension)
+    try:
+        with timed("save_uploaded_file"):
+            return await store_audio_file(spooled_path, file_extension, file.content_type)
+    finally:
+        if os.path.exists(spooled_path):
+            os.remove(spooled_path)
@@ -0,0 +1,231 @@
+# vad.py
+
+import os
+import asyncio
+import tempfile
+from typing import Dict, List, Optional, Tuple
+import ffmpeg
+import numpy as np
+from .transcoding import TRANSCODE_BITRATE, TRANSCODE_SAMPLE_RATE, get_process_pool, _output_format
+from .metrics import Counter, register_metric, timed
+
+# Strip long pauses, intros and dead air before audio is sent for transcription.
+# Segment times are mapped back, so they still match the stored original.
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
+
+# Loudness is measured over frames of this length; cuts land on frame edges
+VAD_FRAME_SECONDS = float(os.getenv("VAD_FRAME_SECONDS", 0.03))
+# A frame is speech when it is this much louder than the recording's noise floor
+# (its 10th percentile frame), and never below VAD_MIN_DB
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", 12))
+VAD_MIN_DB = float(os.getenv("VAD_MIN_DB", -55))
+# Only pauses at least this long are cut, and this much audio is kept either
+# side of speech so word onsets and tails survive. The padding also leaves a
+# short pause between joined regions, so Whisper still hears a break.
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", 1.0))
+VAD_PADDING_SECONDS = float(os.getenv("VAD_PADDING_SECONDS", 0.25))
+# Skip the re-encode unless it removes at least this share of the audio
+VAD_MIN_SAVING = float(os.getenv("VAD_MIN_SAVING", 0.1))
+
+# Decoded audio is read and measured this many frames at a time, so memory use
+# doesn't grow with the length of the recording
+_BLOCK_FRAMES = 10000
+
+FRAME_LENGTH = max(int(VAD_FRAME_SECONDS * TRANSCODE_SAMPLE_RATE), 1)
+# The exact frame duration, after rounding to whole samples
+FRAME_SECONDS = FRAME_LENGTH / TRANSCODE_SAMPLE_RATE
+
+vad_seconds = register_metric(Counter("lingoscribe_vad_audio_seconds_total", "Audio seen by VAD, by kept or removed"))
+
+
+class OffsetMap:
+    """
+    Maps times in the trimmed audio back to the original recording.
+
+    Kept region i spans original [original_starts[i], original_starts[i] + lengths[i])
+    and starts at trimmed_starts[i] in the trimmed audio, right after region i - 1.
+    A time exactly on the join between two regions is the end of the earlier
+    one when it ends a segment, and the start of the later one when it starts a
+    segment. Times past the end snap to the end of the last region.
+    """
+
+    def __init__(self, regions: List[Tuple[float, float]]):
+        self.original_starts = np.array([start for start, _ in regions], dtype=np.float64)
+        self.lengths = np.array([end - start for start, end in regions], dtype=np.float64)
+        self.trimmed_starts = np.concatenate(([0.0], np.cumsum(self.lengths)[:-1]))
+
+    def to_original(self, times: np.ndarray, is_end: bool) -> np.ndarray:
+        index = np.searchsorted(self.trimmed_starts, times, side="left" if is_end else "right") - 1
+        index = np.clip(index, 0, len(self.trimmed_starts) - 1)
+        offset = np.clip(times - self.trimmed_starts[index], 0.0, self.lengths[index])
+        return self.original_starts[index] + offset
+
+    def remap(self, segments: List[Dict]) -> List[Dict]:
+        if not segments:
+            return segments
+        starts = self.to_original(np.array([segment["start"] for segment in segments], dtype=np.float64), False)
+        ends = self.to_original(np.array([segment["end"] for segment in segments], dtype=np.float64), True)
+        return [
+            {**segment, "start": float(start), "end": float(max(end, start))}
+            for segment, start, end in zip(segments, starts, ends)
+        ]
+
+    def remap_callback(self, on_segments):
+        """Wrap a SegmentCallback so streamed segments carry original times too"""
+        async def send_segments(first_index: int, segments: List[Dict]):
+            await on_segments(first_index, self.remap(segments))
+        return send_segments
+
+
+def frame_power(samples: np.ndarray) -> np.ndarray:
+    """Mean square amplitude (0-1) of each whole frame of 16-bit samples"""
+    frame_count = len(samples) // FRAME_LENGTH
+    frames = samples[:frame_count * FRAME_LENGTH].reshape(frame_count, FRAME_LENGTH).astype(np.float32) / 32768.0
+    return np.mean(frames * frames, axis=1)
+
+
+def measure_frames(path: str) -> np.ndarray:
+    """
+    Decode a media file to mono 16 kHz PCM and return the power of each frame.
+
+    ffmpeg's output is read a block at a time; only the per-frame powers (a few
+    bytes per 30 ms) are kept.
+    """
+    process = (
+        ffmpeg
+        .input(path)
+        .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=TRANSCODE_SAMPLE_RATE)
+        .global_args("-loglevel", "error")
+        .run_async(pipe_stdout=True)
+    )
+    block_bytes = _BLOCK_FRAMES * FRAME_LENGTH * 2
+    powers = []
+    try:
+        while True:
+            block = process.stdout.read(block_bytes)
+            if not block:
+                break
+            # A short read at the end of the stream may split a frame; its tail is dropped
+            usable = len(block) - len(block) % 2
+            powers.append(frame_power(np.frombuffer(block[:usable], dtype=np.int16)))
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise Exception(f"ffmpeg could not decode the audio (exit code {returncode})")
+    return np.concatenate(powers) if powers else np.zeros(0, dtype=np.float32)
+
+
+def speech_regions(power: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) frame ranges of the parts of the audio to keep"""
+    frame_count = len(power)
+    if frame_count == 0:
+        return []
+
+    db = 10 * np.log10(np.maximum(power, 1e-20))
+    floor, loud = np.percentile(db, [10, 90])
+    if loud - floor < VAD_MARGIN_DB:
+        if loud <= VAD_MIN_DB:
+            # Nothing but silence
+            return []
+        # No quiet stretches stand out (continuous speech or steady noise): keep it all
+        return [(0, frame_count)]
+    speech = db > max(floor + VAD_MARGIN_DB, VAD_MIN_DB)
+
+    # Widen speech by the padding on both sides (a dilation via cumulative sums)
+    pad = int(round(VAD_PADDING_SECONDS / FRAME_SECONDS))
+    counts = np.concatenate(([0], np.cumsum(speech)))
+    low = np.clip(np.arange(frame_count) - pad, 0, frame_count)
+    high = np.clip(np.arange(frame_count) + pad + 1, 0, frame_count)
+    keep = (counts[high] - counts[low]) > 0
+
+    # Runs of kept frames, as [start, end) frame indices
+    edges = np.diff(np.concatenate(([0], keep.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    if len(run_starts) == 0:
+        return []
+
+    # Pauses shorter than VAD_MIN_SILENCE_SECONDS are kept: join runs across them
+    min_gap = int(round(VAD_MIN_SILENCE_SECONDS / FRAME_SECONDS))
+    split = np.flatnonzero(run_starts[1:] - run_ends[:-1] >= min_gap)
+    starts = run_starts[np.concatenate(([0], split + 1))]
+    ends = run_ends[np.concatenate((split, [len(run_ends) - 1]))]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _write_regions(source_path: str, regions: List[Tuple[int, int]], output_path: str):
+    """
+    Encode only the kept frames. The audio is resampled and split into frames
+    exactly as measure_frames saw it, so `n` (the frame number) in the aselect
+    expression picks out the same frames; ffmpeg streams it all, nothing is
+    buffered in Python.
+    """
+    encoder, _, _ = _output_format()
+    selected = "+".join(f"between(n,{start},{end - 1})" for start, end in regions)
+    (
+        ffmpeg
+        .input(source_path)
+        .audio
+        .filter("aresample", TRANSCODE_SAMPLE_RATE)
+        .filter("aformat", channel_layouts="mono")
+        .filter("asetnsamples", n=FRAME_LENGTH, p=0)
+        .filter("aselect", selected)
+        .filter("asetpts", "N/SR/TB")
+        .output(output_path, ac=1, ar=TRANSCODE_SAMPLE_RATE, acodec=encoder, audio_bitrate=TRANSCODE_BITRATE)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+
+def _strip_silence(source_path: str, output_path: str) -> Tuple[Optional[OffsetMap], float, float]:
+    """
+    Runs inside the process pool. Writes the speech-only audio to `output_path`
+    and returns its offset map, or None if trimming isn't worth it; plus the
+    original and kept durations.
+    """
+    power = measure_frames(source_path)
+    duration = len(power) * FRAME_SECONDS
+    regions = speech_regions(power)
+    kept = sum(end - start for start, end in regions) * FRAME_SECONDS
+    if not regions or duration <= 0 or 1 - kept / duration < VAD_MIN_SAVING:
+        return None, duration, duration
+    _write_regions(source_path, regions, output_path)
+    return OffsetMap([(start * FRAME_SECONDS, end * FRAME_SECONDS) for start, end in regions]), duration, kept
+
+
+async def strip_silence(path: str) -> Tuple[str, Optional[OffsetMap]]:
+    """
+    Remove non-speech stretches from a local audio file.
+
+    Returns (path, offset_map). When something was cut, the path is a new temp
+    file the caller must remove and the map converts its times back to the
+    original; otherwise it is `path` unchanged and the map is None.
+    """
+    if not VAD_ENABLED:
+        return path, None
+
+    _, extension, _ = _output_format()
+    temp_fd, output_path = tempfile.mkstemp(suffix=extension)
+    os.close(temp_fd)
+
+    loop = asyncio.get_running_loop()
+    try:
+        with timed("vad"):
+            offset_map, duration, kept = await loop.run_in_executor(
+                get_process_pool(), _strip_silence, path, output_path
+            )
+    except Exception as e:
+        # VAD only saves cost; transcribe the untouched audio if it fails
+        os.remove(output_path)
+        print(f"Voice activity detection failed, using the full audio: {e}")
+        return path, None
+
+    vad_seconds.inc(kept, part="kept")
+    vad_seconds.inc(duration - kept, part="removed")
+    if offset_map is None:
+        os.remove(output_path)
+        return path, None
+
+    print(f"VAD kept {kept:.0f}s of {duration:.0f}s of audio")
+    return output_path, offset_map
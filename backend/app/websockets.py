@@ -1,31 +1,265 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import os
+import json
+import time
+import asyncio
+import contextvars
+from collections import deque
+from typing import Optional
+from .pubsub import ProgressBackplane, create_backplane
 
 router = APIRouter()
 
+# Outbound events buffered per connection before older progress is dropped. A
+# client that falls this far behind on transcript segments is disconnected.
+WS_QUEUE_MAX = int(os.getenv("WS_QUEUE_MAX", 100))
+
+# A send that takes longer than this means the client is gone or stuck
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 10))
+
+# JSON clients are pinged this often and dropped if they stay silent for WS_IDLE_TIMEOUT
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", 20))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", 60))
+
+# Event types where a newer event for the same job replaces a queued older one
+COALESCED_TYPES = {"progress", "job", "ping"}
+
+# Set while a background job runs so progress messages can be tagged with its id
+progress_job_id: contextvars.ContextVar = contextvars.ContextVar("progress_job_id", default=None)
+
+class ClientConnection:
+    """
+    One websocket plus its outbound queue.
+
+    Producers only append to the queue; a dedicated writer task does the network
+    writes, so a slow or dead client never holds up transcription. Progress that
+    is superseded before it was sent is coalesced, and when the queue is full the
+    oldest coalescable event is dropped first.
+
+    Segment events are never dropped, since the client would silently lose part
+    of the transcript. If the queue fills up with nothing but segments, the
+    connection is closed with code 1013 instead; the client can reconnect and
+    fetch what it missed from /transcripts/{id}/segments/page.
+    """
+    def __init__(self, websocket: WebSocket, client_id: str, json_format: bool):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.json_format = json_format
+        self.pending: deque = deque()
+        self.dropped = 0
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._closer: Optional[asyncio.Task] = None
+        self._on_dead = None
+
+    def start(self, on_dead):
+        self._on_dead = on_dead
+        self._writer = asyncio.create_task(self._write_loop(on_dead))
+
+    def _render(self, event: dict) -> Optional[str]:
+        if self.json_format:
+            return json.dumps(event)
+        if event.get("type") == "progress":
+            return event["message"]
+        # Plain-text clients only understand progress strings
+        return None
+
+    @staticmethod
+    def _coalesce_key(event: dict):
+        if event.get("type") in COALESCED_TYPES:
+            return (event["type"], event.get("jobId"))
+        return None
+
+    def enqueue(self, event: dict):
+        if self.closed or self._render(event) is None:
+            return
+
+        key = self._coalesce_key(event)
+        if key is not None:
+            for queued in self.pending:
+                if self._coalesce_key(queued) == key:
+                    self.pending.remove(queued)
+                    self.dropped += 1
+                    break
+
+        if len(self.pending) >= WS_QUEUE_MAX:
+            victim = next((queued for queued in self.pending if self._coalesce_key(queued) is not None), None)
+            if victim is None:
+                # Only segments are queued and none of them may be dropped
+                self._overflow()
+                return
+            self.pending.remove(victim)
+            self.dropped += 1
+
+        self.pending.append(event)
+        self._wakeup.set()
+
+    async def _write_loop(self, on_dead):
+        try:
+            while True:
+                while not self.pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                text = self._render(self.pending.popleft())
+                await asyncio.wait_for(self.websocket.send_text(text), WS_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Dropping websocket for {self.client_id}: {e!r}")
+            await on_dead(self)
+
+    def _overflow(self):
+        print(f"Websocket for {self.client_id} fell {len(self.pending)} events behind; closing it")
+        self.dropped += len(self.pending)
+        self.pending.clear()
+        # Stop right away so nothing after the gap is sent; enqueue can't await
+        self._stop()
+        self._closer = asyncio.create_task(self._close_overflowed())
+
+    async def _close_overflowed(self):
+        await self._close_socket(1013)
+        if self._on_dead:
+            await self._on_dead(self)
+
+    def _stop(self):
+        self.closed = True
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def _close_socket(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self._stop()
+        await self._close_socket(code)
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
+    """
+    Tracks open websockets by client id.
+
+    Clients connect to /ws/{client_id} and receive progress as plain text. Clients
+    that connect with ?format=json instead receive JSON events such as
+    {"type": "progress", "message": ..., "jobId": ...}, job status updates and
+    streamed transcript segments, plus periodic {"type": "ping"} messages they
+    are expected to answer with any message.
+
+    Events for clients connected to another worker process go through the
+    progress backplane, and that worker delivers them to its own socket.
+    """
+    def __init__(self, backplane: ProgressBackplane = None):
+        self.active_connections: dict[str, ClientConnection] = {}
+        self.backplane = backplane or create_backplane()
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.backplane.start(self._deliver)
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+        for connection in list(self.active_connections.values()):
+            await connection.close(code=1001)
+        self.active_connections.clear()
+        await self.backplane.stop()
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def connect(self, websocket: WebSocket, client_id: str, json_format: bool = False) -> ClientConnection:
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        connection = ClientConnection(websocket, client_id, json_format)
+        previous = self.active_connections.get(client_id)
+        self.active_connections[client_id] = connection
+        if previous:
+            # Same client reconnected; the old socket would otherwise linger open
+            await previous.close(code=4000)
+        connection.start(self._reap)
+        return connection
 
-    def disconnect(self, client_id: str):
-        self.active_connections.pop(client_id, None)
+    def disconnect(self, connection: ClientConnection):
+        # Only remove the entry if it still belongs to this socket, not a newer one
+        if self.active_connections.get(connection.client_id) is connection:
+            del self.active_connections[connection.client_id]
+        connection.closed = True
+        if connection._writer and connection._writer is not asyncio.current_task():
+            connection._writer.cancel()
+
+    async def _reap(self, connection: ClientConnection):
+        await connection.close(code=1011)
+        self.disconnect(connection)
 
     async def send_message(self, message: str, client_id: str):
-        websocket = self.active_connections.get(client_id)
-        if websocket:
-            await websocket.send_text(message)
+        event = {"type": "progress", "message": message}
+        job_id = progress_job_id.get()
+        if job_id:
+            event["jobId"] = job_id
+        await self._publish(client_id, event)
+
+    async def send_event(self, event: dict, client_id: str):
+        """Send a structured event; only delivered to clients using the JSON format"""
+        job_id = progress_job_id.get()
+        if job_id and "jobId" not in event:
+            event = {**event, "jobId": job_id}
+        await self._publish(client_id, event)
+
+    async def _publish(self, client_id: str, event: dict):
+        # Skip the backplane round trip when the socket is on this worker
+        if client_id in self.active_connections:
+            await self._deliver(client_id, event)
+            return
+        try:
+            await self.backplane.publish(client_id, event)
+        except Exception as e:
+            # Lost progress must never fail the job that reported it
+            print(f"Could not publish progress for {client_id}: {e}")
+
+    async def _deliver(self, client_id: str, event: dict):
+        # Never waits on the network; the connection's writer task sends it
+        connection = self.active_connections.get(client_id)
+        if connection:
+            connection.enqueue(event)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            for connection in list(self.active_connections.values()):
+                if not connection.json_format:
+                    # Plain-text clients can't be pinged at the app level; the
+                    # server's protocol-level pings and send timeouts cover them
+                    continue
+                if now - connection.last_seen > WS_IDLE_TIMEOUT:
+                    print(f"Websocket for {connection.client_id} stopped answering pings")
+                    await self._reap(connection)
+                else:
+                    connection.enqueue({"type": "ping"})
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.active_connections),
+            "queued": sum(len(connection.pending) for connection in self.active_connections.values()),
+            "dropped": sum(connection.dropped for connection in self.active_connections.values()),
+            "backplaneDropped": getattr(self.backplane, "dropped", 0),
+        }
 
 manager = ConnectionManager()
 
 @router.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+    json_format = websocket.query_params.get("format") == "json"
+    connection = await manager.connect(websocket, client_id, json_format)
     try:
         while True:
             await websocket.receive_text()  # Keep the connection open
-    except WebSocketDisconnect:
-        manager.disconnect(client_id)
-
+            connection.last_seen = time.monotonic()
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was closed from our side (reaped or replaced)
+        pass
+    finally:
+        manager.disconnect(connection)
@@ -1,29 +1,20 @@
 # whisper_service.py
 
-from openai import OpenAI
-from dotenv import load_dotenv
 import os
 import traceback
-import ffmpeg
 from .websockets import manager
-import asyncio
-from fastapi import BackgroundTasks
 import aiofiles
-import uuid
 import tempfile
-from .supabase_client import supabase
-import httpx
+from .audio_chunking import SegmentCallback
+from .transcoding import prepare_audio
+from .vad import strip_silence
+from .http_client import get_http_client
+from . import stt
+from .utils import storage_object_url, storage_headers
+from .metrics import timed
+from typing import Optional
 
 
-load_dotenv()
-
-# Initialize OpenAI client
-# client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-http_client = httpx.Client()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
-
-BUCKET_NAME = "audio"
-
 async def send_progress(message: str, client_id: str):
     await manager.send_message(message, client_id)
 
@@ -81,15 +72,62 @@ async def send_progress(message: str, client_id: str):
 #         print("YouTube audio download complete.")
 #         return filename, file_url
 
-async def transcribe_audio(file_path: str, client_id: str = None) -> dict:
+async def _download_to_temp(file_path: str, file_extension: str) -> str:
+    """Download a URL or bucket object to a temp file the caller must remove"""
+    if file_path.startswith("http"):
+        # It's a URL, download it to a temp file
+        print(f"Downloading file from URL: {file_path}")
+        download_url, headers = file_path, {}
+    else:
+        # It's a filename in the bucket, download it
+        print(f"Downloading file from Supabase bucket: {file_path}")
+        download_url, headers = storage_object_url(file_path), storage_headers()
+
+    temp_fd, temp_path = tempfile.mkstemp(suffix=file_extension)
+    os.close(temp_fd)
+    
+    try:
+        with timed("download"):
+            async with get_http_client().stream('GET', download_url, headers=headers) as r:
+                if r.status_code != 200:
+                    raise Exception(f"Failed to download file: HTTP {r.status_code}")
+                
+                async with aiofiles.open(temp_path, 'wb') as f:
+                    async for chunk in r.aiter_bytes():
+                        await f.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    
+    print(f"Downloaded to temp file: {temp_path}, size: {os.path.getsize(temp_path)} bytes")
+    return temp_path
+
+async def transcribe_audio(
+    file_path: str,
+    client_id: str = None,
+    prepared: bool = False,
+    on_segments: Optional[SegmentCallback] = None,
+    raise_errors: bool = False,
+) -> dict:
     """
-    Transcribe audio using OpenAI Whisper API
+    Transcribe audio with the configured speech-to-text backend (see stt.py)
+
+    `file_path` can be a URL, a filename in the audio bucket, or a local file.
+    Local files are read in place and left for the caller to remove; pass
+    `prepared=True` if they have already been through prepare_audio.
+    `on_segments` receives segments in order as portions of the audio finish
+    (see transcribe_in_chunks).
+
+    Failures are returned as {"text": <error message>, "segments": []} for the
+    synchronous endpoints; with `raise_errors` they are raised instead.
     """
     if client_id:
         await send_progress("Transcribing...", client_id)
     print("Starting transcription...")
 
     try:
+        is_local = not file_path.startswith("http") and os.path.isfile(file_path)
+
         # Get proper file extension, strip any query parameters
         if file_path.startswith("http"):
             # Extract just the path part of the URL, removing query parameters
@@ -106,75 +144,32 @@ async def transcribe_audio(file_path: str, client_id: str = None) -> dict:
             
         print(f"File extension: {file_extension}")
 
-        if file_path.startswith("http"):
-            # It's a URL, download it to a temp file
-            print(f"Downloading file from URL: {file_path}")
-            temp_fd, temp_path = tempfile.mkstemp(suffix=file_extension)
-            os.close(temp_fd)
-            
-            import httpx
-            async with httpx.AsyncClient() as http_client:
-                async with http_client.stream('GET', file_path) as r:
-                    if r.status_code != 200:
-                        raise Exception(f"Failed to download file: HTTP {r.status_code}")
-                    
-                    with open(temp_path, 'wb') as f:
-                        async for chunk in r.aiter_bytes():
-                            f.write(chunk)
-            
-            print(f"Downloaded to temp file: {temp_path}, size: {os.path.getsize(temp_path)} bytes")
-        else:
-            # It's a filename in the bucket, download it
-            print(f"Downloading file from Supabase bucket: {file_path}")
-            temp_fd, temp_path = tempfile.mkstemp(suffix=file_extension)
-            os.close(temp_fd)
-            
-            try:
-                # Download file from Supabase to temp file
-                file_data = supabase.storage.from_(BUCKET_NAME).download(file_path)
-                print(f"Downloaded data from Supabase, size: {len(file_data)} bytes")
-                
-                with open(temp_path, 'wb') as f:
-                    f.write(file_data)
-                
-                print(f"Wrote to temp file: {temp_path}, size: {os.path.getsize(temp_path)} bytes")
-            except Exception as download_error:
-                print(f"Error downloading from Supabase: {str(download_error)}")
-                raise
-
-        # Since OpenAI client does not support async, use run_in_executor
-        def transcribe():
-            print(f"Opening file for transcription: {temp_path}")
-            with open(temp_path, "rb") as audio_file_sync:
-                response = client.audio.transcriptions.create(
-                    file=audio_file_sync,
-                    model="whisper-1",
-                    response_format="verbose_json"
-                )
-            
-            # Extract the full transcript and segments with timing information
-            full_text = response.text
-            
-            # Process segments with timing information
-            segments = []
-            for segment in response.segments:
-                segments.append({
-                    "text": segment.text,
-                    "start": segment.start,
-                    "end": segment.end
-                })
-            
-            return {
-                "text": full_text,
-                "segments": segments
-            }
-
-        loop = asyncio.get_running_loop()
-        transcript_data = await loop.run_in_executor(None, transcribe)
-
-        # Clean up the temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        source_path = file_path if is_local else await _download_to_temp(file_path, file_extension)
+        audio_path = source_path
+        speech_path = source_path
+        try:
+            if not prepared:
+                # Strip video and downmix/compress before anything is sent to Whisper
+                audio_path, _ = await prepare_audio(source_path)
+            speech_path = audio_path
+            # Long pauses and dead air aren't worth paying to transcribe; the
+            # offset map moves segment times back onto the original audio
+            speech_path, offset_map = await strip_silence(audio_path)
+            if offset_map and on_segments:
+                on_segments = offset_map.remap_callback(on_segments)
+            # Long or large files are split at silences and transcribed in parallel
+            with timed("transcribe"):
+                transcript_data = await stt.transcribe(speech_path, on_segments)
+            if offset_map:
+                transcript_data = {**transcript_data, "segments": offset_map.remap(transcript_data["segments"])}
+        finally:
+            if speech_path != audio_path and os.path.exists(speech_path):
+                os.remove(speech_path)
+            if audio_path != source_path and os.path.exists(audio_path):
+                os.remove(audio_path)
+            # Clean up the temp file, but never a local file we were handed
+            if not is_local and os.path.exists(source_path):
+                os.remove(source_path)
 
         if client_id:
             await send_progress("Transcription complete.", client_id)
@@ -185,6 +180,8 @@ async def transcribe_audio(file_path: str, client_id: str = None) -> dict:
         print(traceback.format_exc())
         if client_id:
             await send_progress(error_message, client_id)
+        if raise_errors:
+            raise Exception(error_message) from e
         return {"text": error_message, "segments": []}
 
 
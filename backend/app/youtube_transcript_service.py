@@ -1,18 +1,36 @@
 # youtube_transcript_service.py
 
 import os
-import requests
-from dotenv import load_dotenv
+import httpx
 from .websockets import manager
-import asyncio
+from .cache import TTLCache, SingleFlight
+from .batching import MicroBatcher
+from .http_client import get_http_client
+from .metrics import timed
+from .segments import SegmentStore
+from .resilience import RetryableStatus, Upstream, raise_for_retryable
 import traceback
+from bisect import bisect_right
 from typing import Tuple, Dict, List, Optional
 
-load_dotenv()
-
-YOUTUBE_TRANSCRIPT_API_URL = "https://www.youtube-transcript.io/api/transcripts"
+YOUTUBE_TRANSCRIPT_API_URL = os.getenv("YOUTUBE_TRANSCRIPT_API_URL", "https://www.youtube-transcript.io/api/transcripts")
 YOUTUBE_TRANSCRIPT_API_KEY = os.getenv("YOUTUBE_TRANSCRIPT_IO_API_KEY")
 
+# Rate limit, retries and circuit breaker for youtube-transcript.io calls
+# (override with YOUTUBE_TRANSCRIPT_RATE_PER_SECOND, _BURST, _MAX_ATTEMPTS, ...)
+youtube_upstream = Upstream.from_env("youtube_transcript", "YOUTUBE_TRANSCRIPT", rate=5, burst=10)
+
+# Popular videos are requested over and over; keep their transcripts around
+YOUTUBE_CACHE_TTL_SECONDS = float(os.getenv("YOUTUBE_CACHE_TTL_SECONDS", 6 * 60 * 60))
+YOUTUBE_CACHE_MAX_ENTRIES = int(os.getenv("YOUTUBE_CACHE_MAX_ENTRIES", 1000))
+
+# Lookups arriving within this window are sent upstream as one request
+YOUTUBE_BATCH_WINDOW_MS = float(os.getenv("YOUTUBE_BATCH_WINDOW_MS", 25))
+YOUTUBE_BATCH_MAX_IDS = int(os.getenv("YOUTUBE_BATCH_MAX_IDS", 50))
+
+transcript_cache = TTLCache(YOUTUBE_CACHE_MAX_ENTRIES, YOUTUBE_CACHE_TTL_SECONDS)
+transcript_requests = SingleFlight()
+
 async def send_progress(message: str, client_id: str):
     """Send progress update via WebSocket"""
     await manager.send_message(message, client_id)
@@ -49,23 +67,286 @@ def extract_video_id(url: str) -> Optional[str]:
     
     return None
 
-async def fetch_youtube_transcript(video_id: str, client_id: str = None) -> Tuple[Dict, str]:
+class CaptionTracks:
+    """
+    Every caption track of one video, from a single youtube-transcript.io response.
+    
+    The whole set is cached per video, so switching language or showing two
+    tracks side by side never needs another API call.
+    """
+    
+    __slots__ = ("languages", "codes", "tracks")
+    
+    def __init__(self):
+        self.languages: List[str] = []
+        self.codes: List[Optional[str]] = []
+        self.tracks: List[SegmentStore] = []
+    
+    def __len__(self) -> int:
+        return len(self.tracks)
+    
+    def add(self, language: str, code: Optional[str], segments: SegmentStore):
+        self.languages.append(language)
+        self.codes.append(code)
+        self.tracks.append(segments)
+    
+    def find(self, preference: Optional[str]) -> Optional[int]:
+        """
+        Index of the first track matching a comma-separated preference list such
+        as "es, en". Entries match a language code ("en" also matches "en-US") or
+        the start of a label ("english" matches "English (auto-generated)").
+        """
+        for wanted in (preference or "").lower().split(","):
+            wanted = wanted.strip()
+            if not wanted:
+                continue
+            labels = [(language.lower(), (code or "").lower()) for language, code in zip(self.languages, self.codes)]
+            # An exact label or code beats a looser match on an earlier track
+            for index, (language, code) in enumerate(labels):
+                if wanted in (language, code):
+                    return index
+            for index, (language, code) in enumerate(labels):
+                if code.startswith(f"{wanted}-") or language.startswith(wanted):
+                    return index
+        return None
+    
+    def key(self, index: int) -> str:
+        """Stable id for a track: its language code, or its label if it has none"""
+        return self.codes[index] or self.languages[index]
+    
+    def lookup(self, key: str) -> Optional[int]:
+        """Index of the track with exactly this key (see `key`); no preference parsing"""
+        for index in range(len(self)):
+            if self.codes[index] == key:
+                return index
+        for index in range(len(self)):
+            if self.languages[index] == key:
+                return index
+        return None
+    
+    def select(self, preference: Optional[str]) -> int:
+        """Like find, but falls back to the first track (usually the primary language)"""
+        index = self.find(preference)
+        return 0 if index is None else index
+    
+    def available(self) -> List[Dict]:
+        return [{"language": language, "code": code} for language, code in zip(self.languages, self.codes)]
+
+def _parse_track(track: Dict) -> Optional[SegmentStore]:
+    """Convert one caption track to a SegmentStore (None if it has no text)"""
+    segments = []
+    
+    for segment in track.get("transcript") or []:
+        # youtube-transcript.io returns format: {"text": str, "start": str, "dur": str}
+        # We need: {"text": str, "start": float, "end": float}
+        text = segment.get("text", "").strip()
+        start = float(segment.get("start", 0))
+        dur = float(segment.get("dur", 0))
+        end = start + dur
+        
+        if text:
+            segments.append({
+                "text": text,
+                "start": start,
+                "end": end
+            })
+    
+    # Cached transcripts are kept compact; the full text is rebuilt from the
+    # segments when needed instead of being stored alongside them
+    return SegmentStore.from_segments(segments) if segments else None
+
+def _parse_video_data(video_data: Dict) -> CaptionTracks:
+    """Convert one video entry of a youtube-transcript.io response to its CaptionTracks"""
+    # Check if transcript exists in tracks
+    if "tracks" not in video_data or not video_data["tracks"]:
+        raise Exception("Unfortunately, there is no transcript available for this video")
+    
+    # Tracks are labelled ("English"); the codes ("en") come in a separate list
+    codes = {
+        entry.get("label"): entry.get("languageCode")
+        for entry in video_data.get("languages") or []
+        if isinstance(entry, dict)
+    }
+    
+    tracks = CaptionTracks()
+    for number, track in enumerate(video_data["tracks"]):
+        segments = _parse_track(track)
+        if segments is None:
+            continue
+        language = track.get("language") or f"Track {number + 1}"
+        tracks.add(language, track.get("languageCode") or codes.get(language), segments)
+    
+    if not tracks:
+        raise Exception("Transcript is empty")
+    return tracks
+
+def align_tracks(primary: SegmentStore, secondary: SegmentStore) -> List[str]:
+    """
+    Text of `secondary` lined up with each segment of `primary`, for a bilingual
+    view. Each secondary segment goes to the primary segment playing at its
+    midpoint (or the nearest one before it), so lines of different lengths
+    still pair up.
+    """
+    aligned = [[] for _ in range(len(primary))]
+    if not aligned:
+        return []
+    for index in range(len(secondary)):
+        midpoint = (secondary.starts[index] + secondary.ends[index]) / 2
+        target = max(bisect_right(primary.starts, midpoint) - 1, 0)
+        aligned[target].append(secondary.text_at(index))
+    return [" ".join(texts) for texts in aligned]
+
+def _transcript_data(tracks: CaptionTracks, language: Optional[str] = None, compare_language: Optional[str] = None) -> Dict:
+    index = tracks.select(language)
+    segments = tracks.tracks[index]
+    transcript_data = {
+        "text": segments.full_text(),
+        "segments": segments,
+        "language": tracks.languages[index],
+        "languageKey": tracks.key(index),
+        "availableLanguages": tracks.available()
+    }
+    
+    comparison = tracks.find(compare_language)
+    if comparison is not None and comparison != index:
+        transcript_data["comparison"] = {
+            "language": tracks.languages[comparison],
+            "languageKey": tracks.key(comparison),
+            "segments": tracks.tracks[comparison],
+            "alignedText": align_tracks(segments, tracks.tracks[comparison])
+        }
+    return transcript_data
+
+async def _download_transcripts(video_ids: List[str]) -> Dict[str, object]:
+    """
+    Request transcripts for several videos in one youtube-transcript.io call.
+    
+    Returns a dict mapping each video ID to its CaptionTracks, or to the
+    Exception describing why that video has no transcript. Successful results
+    are stored in the per-video cache.
+    """
+    print(f"Requesting transcripts for {len(video_ids)} video(s)")
+    
+    # Make API request
+    headers = {
+        "Authorization": f"Basic {YOUTUBE_TRANSCRIPT_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    
+    payload = {
+        "ids": video_ids
+    }
+    
+    async def send():
+        response = await get_http_client().post(
+            YOUTUBE_TRANSCRIPT_API_URL,
+            json=payload,
+            headers=headers,
+            timeout=30
+        )
+        return raise_for_retryable(response)
+    
+    try:
+        with timed("youtube_api"):
+            response = await youtube_upstream.call(send)
+    except RetryableStatus as e:
+        # Still failing after retries; reported like any other error status below
+        response = e.response
+    
+    if response.status_code == 429:
+        raise Exception("Rate limit exceeded. Please wait a moment and try again.")
+    
+    if response.status_code != 200:
+        error_detail = response.text
+        raise Exception(f"API request failed with status {response.status_code}: {error_detail}")
+    
+    data = response.json()
+    if not isinstance(data, list):
+        data = []
+    
+    # Match entries back to the requested IDs; fall back to request order if
+    # the entries don't carry their ID
+    by_id = {entry.get("id"): entry for entry in data if isinstance(entry, dict) and entry.get("id")}
+    if not by_id and len(data) == len(video_ids):
+        by_id = dict(zip(video_ids, data))
+    
+    results = {}
+    for video_id in video_ids:
+        video_data = by_id.get(video_id)
+        if not video_data:
+            results[video_id] = Exception("No transcript available for this video")
+            continue
+        try:
+            tracks = _parse_video_data(video_data)
+        except Exception as e:
+            results[video_id] = e
+            continue
+        transcript_cache.set(video_id, tracks)
+        results[video_id] = tracks
+    return results
+
+transcript_batcher = MicroBatcher(
+    _download_transcripts,
+    max_batch_size=YOUTUBE_BATCH_MAX_IDS,
+    max_delay=YOUTUBE_BATCH_WINDOW_MS / 1000,
+)
+
+def _require_api_key():
+    if not YOUTUBE_TRANSCRIPT_API_KEY:
+        raise Exception("YOUTUBE_TRANSCRIPT_IO_API_KEY not set in environment variables")
+
+async def fetch_caption_tracks(video_id: str) -> CaptionTracks:
+    """Every caption track of a video, from the cache or one (batched, shared) API call"""
+    _require_api_key()
+    cached = transcript_cache.get(video_id)
+    if cached is not None:
+        return cached
+    return await _download_caption_tracks(video_id)
+
+async def _download_caption_tracks(video_id: str) -> CaptionTracks:
+    # Callers check the cache first; checking it again here would count a second miss
+    return await transcript_requests.run(
+        video_id, lambda: transcript_batcher.submit(video_id)
+    )
+
+async def fetch_youtube_transcript(
+    video_id: str,
+    client_id: str = None,
+    language: Optional[str] = None,
+    compare_language: Optional[str] = None,
+) -> Tuple[Dict, str]:
     """
     Fetch transcript from youtube-transcript.io API
     
+    Transcripts are cached per video for YOUTUBE_CACHE_TTL_SECONDS, and concurrent
+    requests for the same video share a single outbound API call. Lookups for
+    different videos arriving within YOUTUBE_BATCH_WINDOW_MS are sent together.
+    All caption tracks are cached, so any language is served from the same fetch.
+    
     Args:
         video_id: YouTube video ID
         client_id: Optional client ID for progress updates
-        
+        language: Preferred languages, e.g. "es, en"; defaults to the first track
+        compare_language: Second track to line up with the first (bilingual view)
+    
     Returns:
         Tuple of (transcript_data, video_id)
-        transcript_data has format: {"text": str, "segments": List[Dict]}
+        transcript_data has format: {"text": str, "segments": SegmentStore,
+        "language": str, "languageKey": str, "availableLanguages": [...]},
+        plus "comparison" when
+        compare_language matched another track
         
     Raises:
         Exception: If API request fails or transcript is not available
     """
-    if not YOUTUBE_TRANSCRIPT_API_KEY:
-        raise Exception("YOUTUBE_TRANSCRIPT_IO_API_KEY not set in environment variables")
+    _require_api_key()
+    
+    cached = transcript_cache.get(video_id)
+    if cached is not None:
+        print(f"Transcript cache hit for video ID: {video_id}")
+        if client_id:
+            await send_progress("Transcript fetched successfully!", client_id)
+        return _transcript_data(cached, language, compare_language), video_id
     
     if client_id:
         await send_progress("Fetching transcript from YouTube...", client_id)
@@ -73,97 +354,25 @@ async def fetch_youtube_transcript(video_id: str, client_id: str = None) -> Tupl
     print(f"Fetching transcript for video ID: {video_id}")
     
     try:
-        # Make API request
-        headers = {
-            "Authorization": f"Basic {YOUTUBE_TRANSCRIPT_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "ids": [video_id]
-        }
-        
-        # Run blocking request in executor to avoid blocking async loop
-        loop = asyncio.get_running_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: requests.post(
-                YOUTUBE_TRANSCRIPT_API_URL,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-        )
-        
-        if response.status_code == 429:
-            raise Exception("Rate limit exceeded. Please wait a moment and try again.")
-        
-        if response.status_code != 200:
-            error_detail = response.text
-            raise Exception(f"API request failed with status {response.status_code}: {error_detail}")
-        
-        data = response.json()
-        
-        # Check if we got transcript data
-        if not data or not isinstance(data, list) or len(data) == 0:
-            raise Exception("No transcript available for this video")
-        
-        video_data = data[0]
-        
-        # Check if transcript exists in tracks
-        if "tracks" not in video_data or not video_data["tracks"]:
-            raise Exception("Unfortunately, there is no transcript available for this video")
-        
-        # Get the first track (usually the primary language)
-        first_track = video_data["tracks"][0]
-        if "transcript" not in first_track or not first_track["transcript"]:
-            raise Exception("Unfortunately, there is no transcript available for this video")
-        
-        transcript_segments = first_track["transcript"]
-        
-        # Convert to our expected format
-        segments = []
-        full_text_parts = []
-        
-        for segment in transcript_segments:
-            # youtube-transcript.io returns format: {"text": str, "start": str, "dur": str}
-            # We need: {"text": str, "start": float, "end": float}
-            text = segment.get("text", "").strip()
-            start = float(segment.get("start", 0))
-            dur = float(segment.get("dur", 0))
-            end = start + dur
-            
-            if text:
-                segments.append({
-                    "text": text,
-                    "start": start,
-                    "end": end
-                })
-                full_text_parts.append(text)
-        
-        full_text = " ".join(full_text_parts)
-        
-        if not full_text:
-            raise Exception("Transcript is empty")
+        with timed("fetch_youtube_transcript"):
+            tracks = await _download_caption_tracks(video_id)
+        transcript_data = _transcript_data(tracks, language, compare_language)
         
         if client_id:
             await send_progress("Transcript fetched successfully!", client_id)
         
-        print(f"Successfully fetched transcript with {len(segments)} segments")
+        print(f"Successfully fetched transcript with {len(transcript_data['segments'])} segments")
         
-        return {
-            "text": full_text,
-            "segments": segments
-        }, video_id
+        return transcript_data, video_id
         
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         error_msg = "Request timed out. Please try again."
         print(f"Error: {error_msg}")
         if client_id:
             await send_progress(error_msg, client_id)
         raise Exception(error_msg)
     
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         error_msg = f"Network error: {str(e)}"
         print(f"Error: {error_msg}")
         if client_id:
@@ -178,13 +387,19 @@ async def fetch_youtube_transcript(video_id: str, client_id: str = None) -> Tupl
             await send_progress(error_msg, client_id)
         raise
 
-async def process_youtube_video(url: str, client_id: str = None) -> Tuple[Dict, str, str]:
+async def process_youtube_video(
+    url: str,
+    client_id: str = None,
+    language: Optional[str] = None,
+    compare_language: Optional[str] = None,
+) -> Tuple[Dict, str, str]:
     """
     Process YouTube video URL and fetch transcript
     
     Args:
         url: YouTube video URL or video ID
         client_id: Optional client ID for progress updates
+        language, compare_language: See fetch_youtube_transcript
         
     Returns:
         Tuple of (transcript_data, video_id, original_url)
@@ -207,7 +422,7 @@ async def process_youtube_video(url: str, client_id: str = None) -> Tuple[Dict,
         print(f"Extracted video ID: {video_id}")
         
         # Fetch transcript
-        transcript_data, video_id = await fetch_youtube_transcript(video_id, client_id)
+        transcript_data, video_id = await fetch_youtube_transcript(video_id, client_id, language, compare_language)
         
         if client_id:
             await send_progress("Processing complete!", client_id)
@@ -0,0 +1,89 @@
+# compare.py
+#
+# Compare two benchmark result files:
+#
+#   python -m benchmarks.compare baseline.json candidate.json --threshold 10
+#
+# Exits with status 1 if any scenario's p95 latency, throughput or peak RSS got
+# worse by more than --threshold percent, so it can gate CI.
+
+import sys
+import json
+import argparse
+from typing import Dict, Optional
+
+# (label, path into the scenario result, True if higher is better)
+METRICS = (
+    ("p50 ms", ("latencyMs", "p50"), False),
+    ("p95 ms", ("latencyMs", "p95"), False),
+    ("p99 ms", ("latencyMs", "p99"), False),
+    ("req/s", ("throughputPerSecond",), True),
+    ("peak RSS MB", ("peakRssBytes",), False),
+)
+
+# Only these are used to decide pass/fail; p50/p99 are shown for context
+GATED = {"p95 ms", "req/s", "peak RSS MB"}
+
+
+def _lookup(result: Dict, path) -> Optional[float]:
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+def _change(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def _format(value: Optional[float]) -> str:
+    return f"{value:.1f}" if value is not None else "n/a"
+
+
+def compare(baseline: Dict, candidate: Dict, threshold: float) -> bool:
+    print(f"baseline {baseline.get('revision')}  ->  candidate {candidate.get('revision')}")
+    ok = True
+    for name, after_result in candidate["scenarios"].items():
+        before_result = baseline["scenarios"].get(name)
+        if before_result is None:
+            print(f"\n{name}: not in baseline")
+            continue
+        print(f"\n{name}")
+        for label, path, higher_is_better in METRICS:
+            before = _lookup(before_result, path)
+            after = _lookup(after_result, path)
+            if label == "peak RSS MB":
+                before = before / (1024 * 1024) if before else before
+                after = after / (1024 * 1024) if after else after
+            change = _change(before, after)
+            regressed = (
+                change is not None
+                and label in GATED
+                and (-change if higher_is_better else change) > threshold
+            )
+            ok = ok and not regressed
+            change_text = f"{change:+.1f}%" if change is not None else "n/a"
+            flag = "  REGRESSION" if regressed else ""
+            print(f"  {label:<12} {_format(before):>10} -> {_format(after):<10} {change_text}{flag}")
+        errors_before = sum(before_result.get("errors", {}).values())
+        errors_after = sum(after_result.get("errors", {}).values())
+        if errors_after != errors_before:
+            print(f"  errors       {errors_before} -> {errors_after}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    sys.exit(0 if compare(baseline, candidate, args.threshold) else 1)
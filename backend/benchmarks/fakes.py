@@ -0,0 +1,255 @@
+# fakes.py
+#
+# Local stand-ins for the external services the backend talks to, so the
+# benchmarks can run without network access or API keys:
+#
+#   - Supabase storage:      POST/GET /storage/v1/object/...
+#   - OpenAI:                POST /v1/audio/transcriptions, POST /v1/chat/completions
+#   - youtube-transcript.io: POST /api/transcripts
+#
+# Each service listens on its own port so the backend keeps one connection pool
+# per upstream, as it does in production. Run on its own with:
+#
+#   python -m benchmarks.fakes --openai-latency-ms 800 --error-rate 0.02
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass
+from typing import Dict
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+
+@dataclass
+class FakeSettings:
+    host: str = "127.0.0.1"
+    storage_port: int = 9101
+    openai_port: int = 9102
+    youtube_port: int = 9103
+    # Fixed delay before every response, plus uniform jitter of up to `jitter_ms`
+    storage_latency_ms: float = 20
+    openai_latency_ms: float = 500
+    youtube_latency_ms: float = 300
+    jitter_ms: float = 50
+    # Whisper also takes time proportional to the audio it is sent
+    whisper_ms_per_mb: float = 200
+    # Delay between streamed chat tokens
+    token_interval_ms: float = 15
+    chat_reply_tokens: int = 60
+    # Fraction of OpenAI and YouTube requests answered with `error_status`
+    error_rate: float = 0.0
+    error_status: int = 500
+    # Segments returned per YouTube transcript
+    youtube_segments: int = 400
+
+
+async def _delay(base_ms: float, settings: FakeSettings, extra_ms: float = 0):
+    await asyncio.sleep((base_ms + extra_ms + random.uniform(0, settings.jitter_ms)) / 1000)
+
+
+def _injected_error(settings: FakeSettings):
+    if settings.error_rate and random.random() < settings.error_rate:
+        headers = {"Retry-After": "1"} if settings.error_status == 429 else {}
+        return JSONResponse(
+            {"error": {"message": "Injected failure", "type": "server_error"}},
+            status_code=settings.error_status,
+            headers=headers,
+        )
+    return None
+
+
+def build_storage_app(settings: FakeSettings) -> FastAPI:
+    app = FastAPI()
+    objects: Dict[str, bytes] = {}
+
+    @app.post("/storage/v1/object/{bucket}/{name:path}")
+    async def upload(bucket: str, name: str, request: Request):
+        body = bytearray()
+        async for chunk in request.stream():
+            body.extend(chunk)
+        await _delay(settings.storage_latency_ms, settings)
+        objects[f"{bucket}/{name}"] = bytes(body)
+        return {"Key": f"{bucket}/{name}"}
+
+    async def download(key: str):
+        await _delay(settings.storage_latency_ms, settings)
+        if key not in objects:
+            return JSONResponse({"error": "not_found"}, status_code=404)
+        return Response(objects[key], media_type="application/octet-stream")
+
+    @app.get("/storage/v1/object/public/{bucket}/{name:path}")
+    async def download_public(bucket: str, name: str):
+        return await download(f"{bucket}/{name}")
+
+    @app.get("/storage/v1/object/{bucket}/{name:path}")
+    async def download_private(bucket: str, name: str):
+        return await download(f"{bucket}/{name}")
+
+    return app
+
+
+def _fake_segments(duration: float, length: float = 5.0):
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = min(start + length, duration)
+        segments.append({
+            "id": len(segments),
+            "seek": 0,
+            "start": start,
+            "end": end,
+            "text": f" Segment number {len(segments)} of the benchmark transcript.",
+            "tokens": [],
+            "temperature": 0.0,
+            "avg_logprob": -0.2,
+            "compression_ratio": 1.2,
+            "no_speech_prob": 0.01,
+        })
+        start = end
+    return segments
+
+
+def _chat_chunk(content: str = None, finish_reason: str = None) -> str:
+    delta = {"content": content} if content is not None else {}
+    chunk = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def build_openai_app(settings: FakeSettings) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        form = await request.form()
+        audio = await form["file"].read()
+        error = _injected_error(settings)
+        megabytes = len(audio) / (1024 * 1024)
+        await _delay(settings.openai_latency_ms, settings, settings.whisper_ms_per_mb * megabytes)
+        if error:
+            return error
+        # Roughly 32 kbit/s audio; the exact figure only affects the segment count
+        duration = max(len(audio) / 4000, 1.0)
+        segments = _fake_segments(duration)
+        return {
+            "task": "transcribe",
+            "language": "english",
+            "duration": duration,
+            "text": "".join(segment["text"] for segment in segments).strip(),
+            "segments": segments,
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = _injected_error(settings)
+        await _delay(settings.openai_latency_ms, settings)
+        if error:
+            return error
+        words = [f"word{i}" for i in range(settings.chat_reply_tokens)]
+
+        if body.get("stream"):
+            async def tokens():
+                for index, word in enumerate(words):
+                    yield _chat_chunk(word if index == 0 else f" {word}")
+                    await asyncio.sleep(settings.token_interval_ms / 1000)
+                yield _chat_chunk(finish_reason="stop")
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(tokens(), media_type="text/event-stream")
+
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+        }
+
+    return app
+
+
+def build_youtube_app(settings: FakeSettings) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/transcripts")
+    async def transcripts(request: Request):
+        body = await request.json()
+        error = _injected_error(settings)
+        await _delay(settings.youtube_latency_ms, settings)
+        if error:
+            return error
+        return [
+            {
+                "id": video_id,
+                "title": f"Benchmark video {video_id}",
+                "tracks": [{
+                    "language": "English",
+                    "transcript": [
+                        {"text": f"Line {index} of video {video_id}.", "start": str(index * 3.0), "dur": "3.0"}
+                        for index in range(settings.youtube_segments)
+                    ],
+                }],
+            }
+            for video_id in body.get("ids", [])
+        ]
+
+    return app
+
+
+def service_urls(settings: FakeSettings) -> Dict[str, str]:
+    """Environment variables that point the backend at these fakes"""
+    return {
+        "SUPABASE_URL": f"http://{settings.host}:{settings.storage_port}",
+        # supabase-py only checks that the key looks like a JWT
+        "SUPABASE_SERVICE_KEY": "bench.bench.bench",
+        "OPENAI_BASE_URL": f"http://{settings.host}:{settings.openai_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "YOUTUBE_TRANSCRIPT_API_URL": f"http://{settings.host}:{settings.youtube_port}/api/transcripts",
+        "YOUTUBE_TRANSCRIPT_IO_API_KEY": "bench",
+    }
+
+
+async def serve(settings: FakeSettings):
+    servers = [
+        uvicorn.Server(uvicorn.Config(build(settings), host=settings.host, port=port, log_level="warning"))
+        for build, port in (
+            (build_storage_app, settings.storage_port),
+            (build_openai_app, settings.openai_port),
+            (build_youtube_app, settings.youtube_port),
+        )
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeSettings()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+
+
+def settings_from_args(args: argparse.Namespace) -> FakeSettings:
+    return FakeSettings(**{name: getattr(args, name) for name in vars(FakeSettings())})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run fake Supabase, OpenAI and youtube-transcript.io servers")
+    add_arguments(parser)
+    settings = settings_from_args(parser.parse_args())
+    for name, value in service_urls(settings).items():
+        print(f"{name}={value}")
+    asyncio.run(serve(settings))
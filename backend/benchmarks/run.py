@@ -0,0 +1,342 @@
+# run.py
+#
+# Load-test the backend against the local fakes and write the results as JSON.
+#
+#   cd backend
+#   python -m benchmarks.run --concurrency 16 --requests 200 --output results.json
+#   python -m benchmarks.compare baseline.json results.json
+#
+# The backend is started as a separate uvicorn process so its peak RSS can be
+# measured on its own; the fakes run in another process.
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import wave
+import random
+import shutil
+import string
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from typing import Awaitable, Callable, Dict, List, Optional
+import httpx
+from .fakes import add_arguments, service_urls, settings_from_args
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("upload", "youtube", "chat", "chat_stream", "ws")
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    """Current resident set size of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """Polls a process's RSS in the background and keeps the peak"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            rss = _rss_bytes(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc_info):
+        self._task.cancel()
+
+
+def make_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """A mono 16-bit tone with a second of silence every five seconds"""
+    frames = bytearray()
+    for index in range(int(seconds * sample_rate)):
+        if (index // sample_rate) % 5 == 4:
+            value = 0
+        else:
+            value = 8000 if (index * 440 * 2 // sample_rate) % 2 else -8000
+        frames += value.to_bytes(2, "little", signed=True)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def _unique_audio(audio: bytes, index: int) -> bytes:
+    # Each request gets distinct content so it misses the transcript cache.
+    # The WAV header is 44 bytes; overwrite the first sample frames after it
+    marker = index.to_bytes(8, "little")
+    return audio[:44] + marker + audio[44 + len(marker):]
+
+
+def _video_id(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(11))
+
+
+class Scenarios:
+    """One coroutine per scenario; each performs a single request and raises on failure"""
+
+    def __init__(self, client: httpx.AsyncClient, base_url: str, args: argparse.Namespace):
+        self.client = client
+        self.base_url = base_url
+        self.args = args
+        self.audio = make_wav(args.audio_seconds)
+        self.rng = random.Random(args.seed)
+        self.video_ids = [_video_id(self.rng) for _ in range(max(args.youtube_distinct_videos, 1))]
+        self.transcript = " ".join(
+            f"Sentence {index} of the benchmark transcript talks about topic {index % 17}."
+            for index in range(args.chat_transcript_sentences)
+        )
+
+    async def upload(self, index: int):
+        response = await self.client.post(
+            f"{self.base_url}/upload/",
+            files={"file": (f"bench-{index}.wav", _unique_audio(self.audio, index), "audio/wav")},
+            data={"client_id": f"bench-{uuid.uuid4()}"},
+        )
+        response.raise_for_status()
+        # Transcription failures still come back as 200 with the error as text
+        if not response.json().get("segments"):
+            raise Exception("Upload returned no segments")
+
+    async def youtube(self, index: int):
+        video_id = self.video_ids[index % len(self.video_ids)]
+        response = await self.client.post(
+            f"{self.base_url}/transcribe-youtube/",
+            json={"url": f"https://www.youtube.com/watch?v={video_id}", "client_id": f"bench-{uuid.uuid4()}"},
+        )
+        response.raise_for_status()
+
+    def _chat_body(self, index: int) -> Dict:
+        return {
+            "transcript": self.transcript,
+            "user_message": f"What does the text say about topic {index % 17}?",
+            "selected_text": "",
+        }
+
+    async def chat(self, index: int):
+        response = await self.client.post(f"{self.base_url}/chat", json=self._chat_body(index))
+        response.raise_for_status()
+
+    async def chat_stream(self, index: int):
+        async with self.client.stream("POST", f"{self.base_url}/chat/stream", json=self._chat_body(index)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event: error"):
+                    raise Exception("Chat stream reported an error")
+                if line.startswith("event: done"):
+                    return
+        raise Exception("Chat stream ended without a done event")
+
+    async def ws(self, index: int):
+        # Connect, receive nothing in particular, and hang up: measures handshake
+        # cost and how many sockets the server holds comfortably
+        import websockets
+
+        ws_url = self.base_url.replace("http", "ws", 1) + f"/ws/bench-{uuid.uuid4()}?format=json"
+        async with websockets.connect(ws_url) as socket:
+            await socket.send("hello")
+            await asyncio.sleep(self.args.ws_hold_seconds)
+
+
+async def run_scenario(
+    request: Callable[[int], Awaitable[None]],
+    total: int,
+    concurrency: int,
+    server_pid: int,
+) -> Dict:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                await request(index)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                kind = type(e).__name__
+                if isinstance(e, httpx.HTTPStatusError):
+                    kind = f"HTTP {e.response.status_code}"
+                errors[kind] = errors.get(kind, 0) + 1
+
+    with RssSampler(server_pid) as sampler:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+        elapsed = time.perf_counter() - started
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": total,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "durationSeconds": round(elapsed, 3),
+        "throughputPerSecond": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latencyMs": {
+            "p50": ms(_percentile(latencies, 50)),
+            "p95": ms(_percentile(latencies, 95)),
+            "p99": ms(_percentile(latencies, 99)),
+            "mean": ms(statistics.fmean(latencies)) if latencies else None,
+            "max": ms(max(latencies)) if latencies else None,
+        },
+        "peakRssBytes": sampler.peak,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def _wait_until_healthy(client: httpx.AsyncClient, url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise Exception(f"{url} exited with code {process.returncode} before becoming ready")
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise Exception(f"{url} did not become ready within {timeout}s")
+
+
+def _stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def main(args: argparse.Namespace) -> Dict:
+    fake_settings = settings_from_args(args)
+    scratch = tempfile.mkdtemp(prefix="lingoscribe-bench-")
+
+    env = dict(os.environ)
+    env.update(service_urls(fake_settings))
+    env.update({
+        "HTTP2_ENABLED": "False",
+        "JOB_DB_PATH": os.path.join(scratch, "jobs.sqlite3"),
+        "TRANSCRIPT_CACHE_PATH": os.path.join(scratch, "transcripts.sqlite3"),
+    })
+
+    fake_args = [f"--{name.replace('_', '-')}={value}" for name, value in vars(fake_settings).items()]
+    fakes = subprocess.Popen([sys.executable, "-m", "benchmarks.fakes", *fake_args], cwd=BACKEND_DIR, env=env)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    results = {
+        "revision": _git_revision(),
+        "startedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            for port in (fake_settings.storage_port, fake_settings.openai_port, fake_settings.youtube_port):
+                await _wait_until_healthy(client, f"http://{fake_settings.host}:{port}/docs", fakes)
+            await _wait_until_healthy(client, f"{base_url}/health", server)
+            results["startupRssBytes"] = _rss_bytes(server.pid)
+
+            scenarios = Scenarios(client, base_url, args)
+            for name in args.scenarios:
+                print(f"Running {name}: {args.requests} requests at concurrency {args.concurrency}")
+                result = await run_scenario(getattr(scenarios, name), args.requests, args.concurrency, server.pid)
+                results["scenarios"][name] = result
+                print(
+                    f"  p50 {result['latencyMs']['p50']} ms, p95 {result['latencyMs']['p95']} ms, "
+                    f"p99 {result['latencyMs']['p99']} ms, {result['throughputPerSecond']}/s, "
+                    f"errors {sum(result['errors'].values())}"
+                )
+    finally:
+        _stop(server)
+        _stop(fakes)
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the backend against local fake upstreams")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--audio-seconds", type=float, default=30)
+    parser.add_argument("--youtube-distinct-videos", type=int, default=1000,
+                        help="fewer distinct videos than requests exercises the transcript cache")
+    parser.add_argument("--chat-transcript-sentences", type=int, default=300)
+    parser.add_argument("--ws-hold-seconds", type=float, default=0.5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,103 @@
+import asyncio
+import os
+
+import pytest
+
+from app import audio_chunking
+from app.audio_chunking import AudioChunk, merge_chunk_transcripts, plan_chunks, transcribe_in_chunks
+
+
+def _result(*segments):
+    return {"segments": [{"text": text, "start": start, "end": end} for text, start, end in segments]}
+
+
+def test_short_audio_is_one_chunk():
+    chunks = plan_chunks(100, [], target=300, overlap=2, search=20)
+    assert chunks == [AudioChunk(start=0.0, end=100, core_start=0.0, core_end=100)]
+
+
+def test_cut_moves_to_nearest_silence():
+    chunks = plan_chunks(500, [(305, 307), (340, 350)], target=300, overlap=2, search=20)
+    assert [chunk.core_end for chunk in chunks] == [306, 500]
+    assert chunks[1].core_start == 306
+
+
+def test_cut_falls_back_to_ideal_point_without_silence():
+    chunks = plan_chunks(700, [(100, 101)], target=300, overlap=2, search=20)
+    assert [(chunk.core_start, chunk.core_end) for chunk in chunks] == [(0.0, 300), (300, 600), (600, 700)]
+
+
+def test_windows_overlap_and_stay_in_bounds():
+    chunks = plan_chunks(700, [], target=300, overlap=2, search=20)
+    assert chunks[0].start == 0.0
+    assert chunks[0].end == 302
+    assert chunks[1].start == 298
+    assert chunks[-1].end == 700
+
+
+def _two_chunks():
+    return [
+        AudioChunk(start=0.0, end=302, core_start=0.0, core_end=300),
+        AudioChunk(start=298, end=400, core_start=300, core_end=400),
+    ]
+
+
+def test_merge_shifts_times_and_keeps_core_segments():
+    merged = merge_chunk_transcripts(_two_chunks(), [
+        _result(("Hello.", 0, 2), ("Past the cut.", 299.5, 301.5)),
+        _result(("Past the cut.", 1.5, 3.5), ("Goodbye.", 10, 12)),
+    ], overlap=2)
+    assert merged["segments"] == [
+        {"text": "Hello.", "start": 0, "end": 2},
+        {"text": "Past the cut.", "start": 299.5, "end": 301.5},
+        {"text": "Goodbye.", "start": 308, "end": 310},
+    ]
+    assert merged["text"] == "Hello. Past the cut. Goodbye."
+
+
+def test_merge_drops_utterance_transcribed_by_both_windows():
+    merged = merge_chunk_transcripts(_two_chunks(), [
+        _result(("Straddling the cut.", 297, 300.5)),
+        _result(("straddling the cut", 1.6, 3.0), ("Next.", 5, 6)),
+    ], overlap=2)
+    assert [segment["text"] for segment in merged["segments"]] == ["Straddling the cut.", "Next."]
+
+
+def test_merge_keeps_repetitions_within_a_chunk():
+    merged = merge_chunk_transcripts(_two_chunks()[:1], [
+        _result(("Bonjour.", 10, 11), ("Bonjour.", 11.5, 12.5), ("Je pense que oui.", 20, 22), ("Oui.", 22.5, 23)),
+    ], overlap=2)
+    assert [segment["text"] for segment in merged["segments"]] == ["Bonjour.", "Bonjour.", "Je pense que oui.", "Oui."]
+
+
+def test_merge_keeps_repetition_spoken_after_the_cut():
+    merged = merge_chunk_transcripts(_two_chunks(), [
+        _result(("Je pense que oui.", 297, 299.8)),
+        _result(("Oui.", 2.2, 3.0)),
+    ], overlap=2)
+    assert [segment["text"] for segment in merged["segments"]] == ["Je pense que oui.", "Oui."]
+
+
+def test_failed_chunk_stops_the_remaining_chunks(tmp_path, monkeypatch):
+    source = tmp_path / "long.mp3"
+    source.write_bytes(b"audio")
+    monkeypatch.setattr(audio_chunking, "detect_silences", lambda path: [])
+    monkeypatch.setattr(audio_chunking, "extract_chunk", lambda path, chunk, output: open(output, "wb").close())
+    started, finished = [], []
+
+    async def transcribe_file(path):
+        started.append(os.path.basename(path))
+        if path.endswith("chunk_0001.mp3"):
+            raise Exception("Whisper returned 500")
+        await asyncio.sleep(0.05)
+        finished.append(os.path.basename(path))
+        return _result(("Hola.", 0, 1))
+
+    async def run():
+        with pytest.raises(Exception, match="Whisper returned 500"):
+            await transcribe_in_chunks(str(source), transcribe_file, max_workers=2, duration=1500)
+
+    asyncio.run(run())
+    # Only the two chunks in flight were sent, and the other one was cancelled
+    assert started == ["chunk_0000.mp3", "chunk_0001.mp3"]
+    assert finished == []
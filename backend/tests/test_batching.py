@@ -0,0 +1,50 @@
+import asyncio
+
+from app.batching import MicroBatcher
+
+
+def test_lookups_are_sent_together():
+    calls = []
+
+    async def handler(keys):
+        calls.append(sorted(keys))
+        return {key: key * 2 for key in keys}
+
+    async def run():
+        batcher = MicroBatcher(handler, max_batch_size=10, max_delay=0.01)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), batcher.submit(1))
+
+    assert asyncio.run(run()) == [2, 4, 2]
+    assert calls == [[1, 2]]
+
+
+def test_handler_error_reaches_every_caller():
+    async def handler(keys):
+        raise Exception("upstream down")
+
+    async def run():
+        batcher = MicroBatcher(handler, max_batch_size=10, max_delay=0.01)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    assert [str(error) for error in asyncio.run(run())] == ["upstream down", "upstream down"]
+
+
+def test_cancelled_dispatch_releases_every_caller():
+    started = None
+
+    async def handler(keys):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def run():
+        nonlocal started
+        started = asyncio.Event()
+        batcher = MicroBatcher(handler, max_batch_size=2, max_delay=60)
+        waiters = [asyncio.ensure_future(batcher.submit(key)) for key in ("a", "b")]
+        await started.wait()
+        for task in batcher._dispatching:
+            task.cancel()
+        return await asyncio.wait_for(asyncio.gather(*waiters, return_exceptions=True), 1)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
@@ -0,0 +1,41 @@
+import re
+
+from app.chat_context import ContextIndex, estimate_tokens, select_transcript_context
+
+SPANISH = [
+    "Hoy vamos a hablar del mercado de la ciudad.",
+    "Mi abuela compraba frutas y verduras allí cada mañana.",
+    "Los vendedores gritaban los precios desde muy temprano.",
+    "Después del mercado, tomábamos un café en la plaza.",
+]
+
+
+def _transcript(repeats):
+    segments = [{"text": f"{SPANISH[i % len(SPANISH)]} ({i})"} for i in range(repeats)]
+    return " ".join(segment["text"] for segment in segments), segments
+
+
+def test_short_transcript_is_sent_whole():
+    transcript, segments = _transcript(4)
+    assert select_transcript_context(transcript, "Summarise this", segments=segments) == (transcript, False)
+
+
+def test_question_in_another_language_still_gets_transcript():
+    transcript, segments = _transcript(2000)
+    context, is_excerpt = select_transcript_context(
+        transcript, "Can you summarise this for me?", segments=segments, budget=500
+    )
+    assert is_excerpt
+    assert estimate_tokens(context) > 400
+    assert estimate_tokens(context) <= 500 + 100  # gap markers aren't budgeted
+    # Spread over the whole transcript, not just its start
+    numbers = [int(n) for n in re.findall(r"\((\d+)\)", context)]
+    assert min(numbers) < 100
+    assert max(numbers) > 1800
+
+
+def test_matching_units_come_before_the_sample():
+    index = ContextIndex([f"{SPANISH[i % 3]} ({i})" for i in range(300)] + ["La playa estaba vacía."])
+    chosen = index.select("playa", budget=100)
+    assert len(index.units) - 1 in chosen
+    assert len(chosen) > 1
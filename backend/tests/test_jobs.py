@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from app.jobs import JobQueue, JobRejected, JobStore
+
+
+async def _noop(payload, context):
+    return None
+
+
+def _queue(tmp_path, max_depth=10, max_per_client=10, store=None):
+    queue = JobQueue(store or JobStore(str(tmp_path / "jobs.sqlite3")), 1, max_depth, max_per_client)
+    queue.register("upload", _noop)
+    return queue
+
+
+def _submit_concurrently(queue, client_ids):
+    async def run():
+        return await asyncio.gather(
+            *(queue.submit("upload", {}, client_id) for client_id in client_ids), return_exceptions=True
+        )
+    return asyncio.run(run())
+
+
+def test_concurrent_submits_respect_queue_depth(tmp_path):
+    queue = _queue(tmp_path, max_depth=3)
+    results = _submit_concurrently(queue, [f"client-{i}" for i in range(8)])
+    rejected = [result for result in results if isinstance(result, JobRejected)]
+    assert len(results) - len(rejected) == 3
+    assert {error.status_code for error in rejected} == {503}
+    assert queue.depth() == 3
+
+
+def test_concurrent_submits_respect_per_client_limit(tmp_path):
+    queue = _queue(tmp_path, max_per_client=2)
+    results = _submit_concurrently(queue, ["client-1"] * 6)
+    rejected = [result for result in results if isinstance(result, JobRejected)]
+    assert len(results) - len(rejected) == 2
+    assert {error.status_code for error in rejected} == {429}
+
+
+def test_failed_record_releases_the_reservation(tmp_path):
+    class BrokenStore(JobStore):
+        def create(self, *args):
+            raise Exception("disk full")
+
+    queue = _queue(tmp_path, max_depth=1, max_per_client=1, store=BrokenStore(str(tmp_path / "jobs.sqlite3")))
+
+    async def run():
+        with pytest.raises(Exception, match="disk full"):
+            await queue.submit("upload", {}, "client-1")
+
+    asyncio.run(run())
+    assert queue.depth() == 0
+    assert queue._per_client == {}
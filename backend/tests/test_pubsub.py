@@ -0,0 +1,116 @@
+import asyncio
+
+from app.pubsub import InMemoryBackplane, RedisBackplane
+
+
+class FakeBroker:
+    """Redis pub/sub stand-in shared by several 'workers'"""
+
+    def __init__(self):
+        self.subscribers = []
+        self.down = False
+
+    def client(self):
+        return FakeRedis(self)
+
+
+class FakeRedis:
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self.broker)
+
+    async def publish(self, channel, message):
+        if self.broker.down:
+            raise ConnectionError("Connection refused")
+        for subscriber in self.broker.subscribers:
+            if channel in subscriber.channels:
+                subscriber.inbox.put_nowait({"data": message})
+
+    async def close(self):
+        pass
+
+
+class FakePubSub:
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+        self.channels = set()
+        self.inbox = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.channels.add(channel)
+        self.broker.subscribers.append(self)
+
+    async def unsubscribe(self, channel):
+        self.channels.discard(channel)
+
+    async def listen(self):
+        while True:
+            yield await self.inbox.get()
+
+    async def close(self):
+        if self in self.broker.subscribers:
+            self.broker.subscribers.remove(self)
+
+
+async def _wait_for(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_events_reach_other_workers():
+    async def run():
+        broker = FakeBroker()
+        received = {"a": [], "b": []}
+        workers = {name: RedisBackplane("redis://fake", client=broker.client()) for name in received}
+        for name, backplane in workers.items():
+            async def deliver(client_id, event, name=name):
+                received[name].append((client_id, event))
+            await backplane.start(deliver)
+
+        await workers["a"].publish("client-1", {"type": "progress", "message": "Transcribing..."})
+        await _wait_for(lambda: received["b"])
+        for backplane in workers.values():
+            await backplane.stop()
+        return received
+
+    received = asyncio.run(run())
+    assert received["b"] == [("client-1", {"type": "progress", "message": "Transcribing..."})]
+    assert received["a"] == received["b"]
+
+
+def test_publish_survives_redis_being_down():
+    async def run():
+        broker = FakeBroker()
+        backplane = RedisBackplane("redis://fake", client=broker.client())
+
+        async def deliver(client_id, event):
+            pass
+
+        await backplane.start(deliver)
+        broker.down = True
+        # Returns at once and never raises into the job reporting progress
+        await asyncio.wait_for(backplane.publish("client-1", {"type": "progress", "message": "x"}), 0.1)
+        await _wait_for(lambda: backplane.dropped == 1)
+        await backplane.stop()
+
+    asyncio.run(run())
+
+
+def test_in_memory_backplane_delivers_locally():
+    async def run():
+        received = []
+
+        async def deliver(client_id, event):
+            received.append((client_id, event))
+
+        backplane = InMemoryBackplane()
+        await backplane.start(deliver)
+        await backplane.publish("client-1", {"type": "job", "jobId": "j1"})
+        return received
+
+    assert asyncio.run(run()) == [("client-1", {"type": "job", "jobId": "j1"})]
@@ -0,0 +1,36 @@
+import asyncio
+
+from app.transcript_cache import TranscriptCache
+
+
+class NoQueries:
+    def execute(self, *args):
+        raise AssertionError("stats() must not query SQLite")
+
+
+def test_stats_are_kept_in_memory(tmp_path):
+    cache = TranscriptCache(str(tmp_path / "transcripts.sqlite3"), 1024 * 1024)
+    transcript = {"text": "Hola.", "segments": [{"text": "Hola.", "start": 0.0, "end": 1.0}]}
+
+    async def run():
+        await cache.put("hash-1", transcript, "audio.mp3")
+        await cache.put("hash-2", transcript, "audio.mp3")
+        await cache.get("hash-1")
+        await cache.get("hash-3")
+
+    asyncio.run(run())
+    cache._connection, connection = NoQueries(), cache._connection
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (2, 1, 1)
+    assert stats["bytes"] > 0
+    connection.close()
+
+
+def test_totals_are_loaded_when_the_database_is_opened(tmp_path):
+    path = str(tmp_path / "transcripts.sqlite3")
+    transcript = {"text": "Hola.", "segments": []}
+    asyncio.run(TranscriptCache(path, 1024 * 1024).put("hash-1", transcript, None))
+
+    cache = TranscriptCache(path, 1024 * 1024)
+    cache.warm()
+    assert cache.stats()["entries"] == 1
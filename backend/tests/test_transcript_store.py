@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from app import transcript_store, youtube_transcript_service
+from app.cache import TTLCache
+
+
+class FailingBatcher:
+    async def submit(self, video_id):
+        raise AssertionError("read routes must not fetch from youtube-transcript.io")
+
+
+@pytest.fixture
+def youtube_cache(monkeypatch):
+    cache = TTLCache(10, 60)
+    monkeypatch.setattr(transcript_store, "youtube_cache", cache)
+    monkeypatch.setattr(transcript_store, "_transcripts", TTLCache(10, 60))
+    monkeypatch.setattr(youtube_transcript_service, "transcript_batcher", FailingBatcher())
+    return cache
+
+
+def test_unknown_youtube_transcript_is_not_fetched(youtube_cache):
+    assert asyncio.run(transcript_store.get_transcript("yt-dQw4w9WgXcQ:en")) is None
+
+
+def test_youtube_transcript_is_rebuilt_from_the_cache(youtube_cache):
+    youtube_cache.set("video-1", youtube_transcript_service._parse_video_data({
+        "tracks": [
+            {"language": "Spanish", "languageCode": "es", "transcript": [{"text": "Hola.", "start": "0", "dur": "1"}]},
+            {"language": "English", "languageCode": "en", "transcript": [{"text": "Hello.", "start": "0", "dur": "1"}]},
+        ],
+    }))
+    transcript = asyncio.run(transcript_store.get_transcript("yt-video-1:en"))
+    assert transcript.segments[0]["text"] == "Hello."
+    assert asyncio.run(transcript_store.get_transcript("yt-video-1:fr")) is None
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from app.vad import FRAME_SECONDS, OffsetMap, frame_power, speech_regions
+
+SAMPLE_RATE = 16000
+
+
+def _tone(seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * 32767 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+
+def _quiet(seconds):
+    rng = np.random.default_rng(0)
+    return rng.normal(0, 3, int(seconds * SAMPLE_RATE)).astype(np.int16)
+
+
+def _regions_in_seconds(*pieces):
+    power = frame_power(np.concatenate(pieces))
+    return [(start * FRAME_SECONDS, end * FRAME_SECONDS) for start, end in speech_regions(power)]
+
+
+@pytest.fixture
+def offset_map():
+    # Kept 2-5s and 10-12s of the original; trimmed audio is 0-3s then 3-5s
+    return OffsetMap([(2.0, 5.0), (10.0, 12.0)])
+
+
+def test_times_inside_a_region_shift_by_the_cut_audio(offset_map):
+    assert offset_map.to_original(np.array([0.0, 1.5, 4.0]), False).tolist() == [2.0, 3.5, 11.0]
+
+
+def test_time_on_a_region_boundary(offset_map):
+    # Where the two regions were joined: an end belongs to the first, a start to the second
+    assert offset_map.to_original(np.array([3.0]), True).tolist() == [5.0]
+    assert offset_map.to_original(np.array([3.0]), False).tolist() == [10.0]
+
+
+def test_times_never_land_in_removed_audio(offset_map):
+    times = np.linspace(0, 6, 601)
+    for is_end in (False, True):
+        mapped = offset_map.to_original(times, is_end)
+        assert not np.any((mapped > 5.0) & (mapped < 10.0))
+        assert not np.any(mapped < 2.0)
+
+
+def test_times_past_the_last_region_snap_to_its_end(offset_map):
+    assert offset_map.to_original(np.array([5.0, 7.5]), False).tolist() == [12.0, 12.0]
+    assert offset_map.to_original(np.array([7.5]), True).tolist() == [12.0]
+
+
+def test_remap_keeps_segment_fields(offset_map):
+    segments = offset_map.remap([{"text": "Bonjour", "start": 2.5, "end": 3.5, "id": 1}])
+    assert segments == [{"text": "Bonjour", "start": 4.5, "end": 10.5, "id": 1}]
+
+
+def test_long_pause_is_cut_with_padding():
+    regions = _regions_in_seconds(_tone(2), _quiet(3), _tone(2))
+    assert len(regions) == 2
+    assert regions[0][0] == 0
+    assert regions[0][1] == pytest.approx(2.25, abs=0.05)
+    assert regions[1][0] == pytest.approx(4.75, abs=0.05)
+    assert regions[1][1] == pytest.approx(7.0, abs=0.05)
+
+
+def test_short_pause_is_kept():
+    regions = _regions_in_seconds(_tone(2), _quiet(0.5), _tone(2), _quiet(3))
+    assert len(regions) == 1
+    assert regions[0][1] == pytest.approx(4.75, abs=0.05)
+
+
+def test_all_silent_audio_has_no_regions():
+    assert speech_regions(frame_power(np.zeros(5 * SAMPLE_RATE, dtype=np.int16))) == []
+
+
+def test_audio_without_quiet_stretches_is_kept_whole():
+    power = frame_power(_tone(5))
+    assert speech_regions(power) == [(0, len(power))]
+
+
+def test_empty_audio_has_no_regions():
+    assert speech_regions(np.zeros(0, dtype=np.float32)) == []
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from app import youtube_transcript_service as service
+from app.cache import SingleFlight, TTLCache
+
+
+class FakeBatcher:
+    def __init__(self):
+        self.requested = []
+
+    async def submit(self, video_id):
+        self.requested.append(video_id)
+        tracks = service._parse_video_data({
+            "tracks": [{
+                "language": "Spanish",
+                "languageCode": "es",
+                "transcript": [{"text": "Hola a todos.", "start": "0", "dur": "1.5"}],
+            }],
+        })
+        service.transcript_cache.set(video_id, tracks)
+        return tracks
+
+
+@pytest.fixture
+def batcher(monkeypatch):
+    batcher = FakeBatcher()
+    monkeypatch.setattr(service, "YOUTUBE_TRANSCRIPT_API_KEY", "test-key")
+    monkeypatch.setattr(service, "transcript_cache", TTLCache(10, 60))
+    monkeypatch.setattr(service, "transcript_requests", SingleFlight())
+    monkeypatch.setattr(service, "transcript_batcher", batcher)
+    return batcher
+
+
+def test_cold_fetch_counts_one_miss(batcher):
+    async def run():
+        await service.fetch_youtube_transcript("video-1")
+        await service.fetch_youtube_transcript("video-2")
+        await service.fetch_youtube_transcript("video-1")
+
+    asyncio.run(run())
+    assert batcher.requested == ["video-1", "video-2"]
+    stats = service.transcript_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_fetch_caption_tracks_counts_one_miss(batcher):
+    tracks = asyncio.run(service.fetch_caption_tracks("video-1"))
+    assert tracks.key(0) == "es"
+    assert service.transcript_cache.stats()["misses"] == 1